@@ -1,6 +1,6 @@
 import math
 import random
-from typing import Literal
+from typing import Literal, Optional
 
 from .message import *
 from .coord import MOVE_TO_DIRECTION
@@ -8,6 +8,8 @@ from .Player import Player, HumanPlayer
 
 class NPC(Player):
     """ Represents a non-player character in the game."""
+    TALKED_TO_PREFIX = 'talked_to/' # the key talked_to/<email> is set once the NPC has talked to the player
+
     def __init__(self, name: str, image: str, encounter_text : str, facing_direction: Literal['up', 'down', 'left', 'right'] = 'down', staring_distance: int = 0, bg_music='') -> None:
         """ Initialize the NPC with the given name, image, and facing direction.
             encounter_text: text that will be displayed when the player interacts with the NPC.
@@ -16,6 +18,7 @@ class NPC(Player):
         self.__staring_distance: int = staring_distance
         self.__encounter_text: str = encounter_text
         self.__bg_music: str = bg_music
+        self.__talked_to_players: Optional[set[str]] = None # loaded from the database when first needed
         super().__init__(
             name=name,
             image=image,
@@ -81,15 +84,26 @@ class NPC(Player):
         messages.extend(interact_messages)
 
         # mark that we have talked to the player
-        talked_to_players = self.get_state('talked_to_players', [])
-        talked_to_players.append(player.get_email())
-        self.set_state('talked_to_players', talked_to_players)
+        talked_to_players = self.__get_talked_to_players()
+        if player.get_email() not in talked_to_players:
+            # one key per player, so only the new email is written (and concurrent writes cannot conflict)
+            self.set_state(self.TALKED_TO_PREFIX + player.get_email(), True)
+            talked_to_players.add(player.get_email())
 
         return messages
 
+    def __get_talked_to_players(self) -> set[str]:
+        # the emails of the players the NPC has talked to are kept in memory as a set, since they are checked
+        # every time a player moves; the database only receives the new ones
+        if self.__talked_to_players is None:
+            state = self.get_full_state()
+            talked_to_players = set(state.get('talked_to_players', [])) # as the list was stored before
+            talked_to_players.update(key[len(self.TALKED_TO_PREFIX):] for key in state if key.startswith(self.TALKED_TO_PREFIX))
+            self.__talked_to_players = talked_to_players
+        return self.__talked_to_players
+
     def done_talking(self, player) -> bool:
-        talked_to_players = self.get_state('talked_to_players', [])
-        return player.get_email() in talked_to_players
+        return player.get_email() in self.__get_talked_to_players()
         
     def player_interacted(self, player: HumanPlayer) -> list[Message]:
         """ Handle the event of the player interacting with the NPC. In the default case,
@@ -3,6 +3,7 @@ from typing import Any, Literal, TYPE_CHECKING
 from .message import *
 from .coord import Coord
 from .database_entity import DatabaseEntity
+from .user_directory import user_directory
 from .tiles.map_objects import CharacterMapObject
 
 if TYPE_CHECKING:
@@ -124,6 +125,7 @@ class HumanPlayer(Player, RecipientInterface):
         
         self.set_state("cur_room", new_room.get_name())
         messages: list[Message] = super().change_room(new_room, msg_to_cur_room, msg_to_new_room, entry_point)
+        user_directory.player_changed_room(self, new_room.get_name())
 
         first_messages: list[Message] = []
         if self._current_room is not None:
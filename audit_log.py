@@ -0,0 +1,112 @@
+import os
+import time
+import atexit
+import sqlite3
+import threading
+import traceback
+from collections import deque
+from typing import NamedTuple, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS audit_log (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    event TEXT NOT NULL,
+    user TEXT NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS audit_log_user ON audit_log (user, time);
+CREATE INDEX IF NOT EXISTS audit_log_event ON audit_log (event, time);
+"""
+
+INSERT_RECORD = "INSERT INTO audit_log (time, event, user, message) VALUES (?, ?, ?, ?)"
+
+class AuditRecord(NamedTuple):
+    time: float
+    event: str
+    user: str
+    message: str
+
+class AuditLog:
+    """ Records audit events (e.g., a player registering a repository) in a SQLite table indexed by user
+        and by event. record() only appends to a bounded in-memory ring; a background thread writes the
+        records in batches, so that logging does not make a command wait on the disk. If the writer falls
+        behind by more than RING_SIZE records, the oldest ones are dropped (and counted).
+    """
+    PATH = os.environ.get('AUDIT_LOG_PATH', 'audit_log.sqlite3')
+    RING_SIZE = 10000
+    BATCH_SIZE = 500
+    FLUSH_INTERVAL = 1 # seconds between batches
+
+    def __init__(self, path: str = PATH) -> None:
+        self.__path: str = path
+        self.__lock = threading.Lock()
+        self.__pending: deque[AuditRecord] = deque(maxlen=self.RING_SIZE)
+        self.__dropped: int = 0
+        self.__has_pending = threading.Event()
+        self.__idle = threading.Event()
+        self.__idle.set()
+        self.__writer_t = None
+
+    def record(self, event: str, message: str, user: str = "") -> None:
+        """ Queue a record of the event to be written. """
+        with self.__lock:
+            if len(self.__pending) == self.RING_SIZE:
+                self.__dropped += 1
+            self.__pending.append(AuditRecord(time.time(), str(event), str(user), str(message)))
+            self.__idle.clear()
+            if self.__writer_t is None:
+                self.__writer_t = threading.Thread(target=self.__write_loop, daemon=True)
+                self.__writer_t.start()
+                atexit.register(self.flush)
+        if len(self.__pending) >= self.BATCH_SIZE:
+            self.__has_pending.set()
+
+    def flush(self, timeout: float = 10) -> None:
+        """ Wait until the queued records have been written. """
+        self.__has_pending.set()
+        self.__idle.wait(timeout)
+
+    def get_dropped_count(self) -> int:
+        return self.__dropped
+
+    def query(self, user: Optional[str] = None, event: Optional[str] = None, limit: int = 100) -> list[AuditRecord]:
+        """ Returns the most recent records (newest first), of the given user and/or event if not None. """
+        self.flush()
+        conditions, params = [], []
+        if user is not None:
+            conditions.append("user = ?")
+            params.append(user)
+        if event is not None:
+            conditions.append("event = ?")
+            params.append(event)
+        where = f"WHERE {' AND '.join(conditions)}" if len(conditions) > 0 else ""
+        if not os.path.exists(self.__path):
+            return []
+        connection = sqlite3.connect(self.__path)
+        try:
+            rows = connection.execute(f"SELECT time, event, user, message FROM audit_log {where} ORDER BY time DESC, id DESC LIMIT ?", params + [limit]).fetchall()
+        finally:
+            connection.close()
+        return [AuditRecord(*row) for row in rows]
+
+    def __write_loop(self) -> None:
+        connection = sqlite3.connect(self.__path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        while True:
+            self.__has_pending.wait(self.FLUSH_INTERVAL)
+            self.__has_pending.clear()
+            while True:
+                with self.__lock:
+                    batch = [self.__pending.popleft() for _ in range(min(self.BATCH_SIZE, len(self.__pending)))]
+                    if len(batch) == 0:
+                        self.__idle.set()
+                        break
+                try:
+                    with connection: # one transaction per batch
+                        connection.executemany(INSERT_RECORD, batch)
+                except:
+                    print(f"Could not write {len(batch)} audit records:\n{traceback.format_exc()}")
+
+audit_log = AuditLog()
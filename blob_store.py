@@ -0,0 +1,58 @@
+import os
+import zlib
+import hashlib
+import tempfile
+
+class BlobStore:
+    """ Stores file contents on disk, compressed, under the SHA-256 hash of the content, so that identical
+        files (e.g., the same file in two pulls, or in the repositories of two partners) are stored once.
+        Blobs are never modified once written, so they can be read without locking.
+    """
+    BLOB_DIR = os.environ.get('BLOB_DIR', './blobs')
+    COMPRESSION_LEVEL = 6
+
+    def get_hash(self, data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def __get_path(self, digest: str) -> str:
+        return os.path.join(self.BLOB_DIR, digest[:2], digest[2:])
+
+    def has(self, digest: str) -> bool:
+        return os.path.exists(self.__get_path(digest))
+
+    def put(self, data: bytes) -> str:
+        """ Store the data (unless it is already stored) and return its hash. """
+        digest = self.get_hash(data)
+        path = self.__get_path(digest)
+        if os.path.exists(path):
+            return digest
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(zlib.compress(data, self.COMPRESSION_LEVEL))
+            os.replace(tmp_path, path) # concurrent writers of the same blob write the same content
+        except:
+            os.remove(tmp_path)
+            raise
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        """ Returns the data with the given hash. Raises KeyError if there is none, or ValueError if the blob
+            is corrupt (then it is deleted, so that the next put of the data stores it again).
+        """
+        path = self.__get_path(digest)
+        try:
+            with open(path, 'rb') as f:
+                data = zlib.decompress(f.read())
+        except FileNotFoundError:
+            raise KeyError(digest)
+        except zlib.error:
+            data = None
+        if data is None or self.get_hash(data) != digest:
+            os.remove(path)
+            raise ValueError(f"The blob {digest} is corrupt.")
+        return data
+
+blob_store = BlobStore()
@@ -0,0 +1,109 @@
+import os
+import re
+import json
+import atexit
+import hashlib
+import threading
+import traceback
+from typing import Optional
+
+class Checkpointer:
+    """ Saves checkpoints of the runtime state of the world (see Map.get_runtime_state) into a directory,
+        as one JSON file per room plus one for the players, so that the world can be restored after a
+        restart. Checkpoints are incremental: a file is only rewritten when its content has changed since
+        it was last written. save() only queues the states, which are encoded and written by a background
+        thread, so that the thread that captured them (e.g., the one ticking the world) never waits on disk.
+    """
+    PLAYERS_FILE = 'players.json'
+
+    def __init__(self, directory: str) -> None:
+        self.__directory: str = directory
+        self.__lock = threading.Lock()
+        self.__pending: dict[str, dict] = {} # the latest state to write for each file, by filename
+        self.__has_pending = threading.Event()
+        self.__idle = threading.Event()
+        self.__idle.set()
+        self.__written_hashes: dict[str, str] = {} # hash of the content of each file on disk
+        self.__writer_t = None
+
+    def __get_room_filename(self, room_name: str) -> str:
+        return re.sub(r'[^A-Za-z0-9_-]', '_', room_name) + '.room.json'
+
+    def load(self) -> tuple[dict[str, dict], dict[str, dict]]:
+        """ Returns the saved states of the rooms (by room name) and of the players (by player name). """
+        room_states: dict[str, dict] = {}
+        player_states: dict[str, dict] = {}
+        if not os.path.isdir(self.__directory):
+            return room_states, player_states
+
+        for filename in os.listdir(self.__directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.__directory, filename), 'rb') as f:
+                    content = f.read()
+                checkpoint = json.loads(content)
+            except:
+                print(f"Ignoring unreadable checkpoint {filename}:\n{traceback.format_exc()}")
+                continue
+            self.__written_hashes[filename] = hashlib.sha256(content).hexdigest()
+            if filename == self.PLAYERS_FILE:
+                player_states = checkpoint
+            else:
+                room_states[checkpoint['room']] = checkpoint['state']
+        return room_states, player_states
+
+    def save(self, room_states: dict[str, dict], player_states: Optional[dict[str, dict]] = None) -> None:
+        """ Queue the given states to be written. Rooms that are not given keep their last checkpoint.
+
+        Arguments:
+            room_states: the runtime state of each room, by room name
+            player_states: the state of every player, by player name (None to keep the last checkpoint)
+        """
+        with self.__lock:
+            for room_name, state in room_states.items():
+                self.__pending[self.__get_room_filename(room_name)] = {'room': room_name, 'state': state}
+            if player_states is not None:
+                self.__pending[self.PLAYERS_FILE] = player_states
+            self.__idle.clear()
+            self.__has_pending.set()
+            if self.__writer_t is None:
+                self.__writer_t = threading.Thread(target=self.__write_loop, daemon=True)
+                self.__writer_t.start()
+                atexit.register(self.flush)
+
+    def flush(self, timeout: float = 10) -> None:
+        """ Wait until the queued states have been written. """
+        self.__idle.wait(timeout)
+
+    def __write_loop(self) -> None:
+        while True:
+            self.__has_pending.wait()
+            with self.__lock:
+                pending, self.__pending = self.__pending, {}
+                self.__has_pending.clear()
+
+            for filename, checkpoint in pending.items():
+                try:
+                    self.__write(filename, checkpoint)
+                except:
+                    print(f"Could not write checkpoint {filename}:\n{traceback.format_exc()}")
+
+            with self.__lock:
+                if len(self.__pending) == 0:
+                    self.__idle.set()
+
+    def __write(self, filename: str, checkpoint: dict) -> None:
+        content = json.dumps(checkpoint, sort_keys=True).encode('utf-8')
+        digest = hashlib.sha256(content).hexdigest()
+        if self.__written_hashes.get(filename) == digest:
+            return # unchanged since the last checkpoint
+
+        os.makedirs(self.__directory, exist_ok=True)
+        path = os.path.join(self.__directory, filename)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path) # a crash leaves either the previous checkpoint or the new one
+        self.__written_hashes[filename] = digest
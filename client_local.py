@@ -32,6 +32,7 @@ except:
     raise Exception("You must pip3 install requests websocket-client pygame Pillow")
 
 from .util import shorten_lines
+from .file_downloader import FileDownloader
 from .resources import get_resource_path
 
 TILE_SIZE = 32
@@ -233,23 +234,13 @@ class NetworkManager:
         self.__server_outbox = server_outbox
         self._resource_manager = resource_manager
         self._data_dict = {}
+        self.__downloader = FileDownloader()
 
-    def download_file(self, path):
-        # curl the file
-        url = f"https://infinite-fortress-70189.herokuapp.com/{path}"
-        print(url)
-        response = requests.get(url)
-        # check response code
-        if response.status_code != 200:
-            raise Exception(f"Could not load {path} from server. Status code: {response.status_code}")
-        data = response.content
-        
-        # get stem of path
-        stem = os.path.basename(path)
-        # save to disk
-        with open(stem, 'wb') as f:
-            f.write(data)
-        print(f"Downloaded {path} to {stem}")
+    def download_file(self, path, url=None, size=None, sha256=None):
+        # download the file in the background, into the current directory
+        if url is None:
+            url = f"https://infinite-fortress-70189.herokuapp.com/{path}"
+        self.__downloader.download(url, os.path.basename(path), size, sha256)
 
     def update_data(self, data_dict: dict) -> None:
         self._data_dict = data_dict
@@ -323,7 +314,7 @@ class NetworkManager:
             #menu_window = MenuWindow(self._root_window, self, self._resource_manager, menu_name, menu_options)
             #menu_window.run()
         elif data['classname'] == 'FileMessage':
-            self.download_file(data['file_path'])
+            self.download_file(data['file_path'], data.get('url'), data.get('size'), data.get('sha256'))
         else:
             print(f"Bad message (unknown class name): {message}")
 
@@ -1,4 +1,5 @@
-from typing import TYPE_CHECKING
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
 from abc import ABC, abstractmethod
 
 from .message import Message, SenderInterface
@@ -20,10 +21,24 @@ class MenuCommand(Command):
         """Execute the command using the provided context and return messages."""
         pass
 
+@lru_cache(maxsize=1024)
+def split_args(args_text: str, separator: Optional[str], maxsplit: int) -> tuple[str, ...]:
+    """ Splits the text that follows a command name into arguments (see ChatCommand.parse_args). """
+    if separator is None:
+        return tuple(args_text.split(maxsplit=maxsplit))
+    args = args_text.split(separator, maxsplit + 1 if maxsplit >= 0 else -1)
+    if len(args) > 0 and args[0] == '': # the separator that follows the command name
+        args = args[1:]
+    return tuple(args)
+
 class ChatCommand(Command):
     name = ''
     desc = ''
     visibility = 'public'
+    arg_separator: Optional[str] = None # what separates the arguments of the command (None for whitespace)
+    blocking: bool = False # whether the command may take long (e.g., network calls), so that it runs in the background
+    rate_class: str = 'command' # how often players may use the command (see RateLimiter.RATE_CLASSES)
+    aliases: tuple[str, ...] = () # other names that the command text may start with (e.g., abbreviations)
 
     @classmethod
     @abstractmethod
@@ -36,4 +51,53 @@ class ChatCommand(Command):
     @abstractmethod
     def execute(self, command_text: str, context: "Map", player: "HumanPlayer") -> list[Message]:
         """Execute the command using the provided context and return messages."""
-        pass
\ No newline at end of file
+        pass
+
+    def get_acknowledgement(self, command_text: str) -> str:
+        """ Returns the message sent to the player when a blocking command starts running in the background. """
+        return f"Running /{self.name}. You will be notified when it completes."
+
+    def parse_args(self, command_text: str, maxsplit: int = -1) -> tuple[str, ...]:
+        """ Returns the arguments that follow the name of the command in command_text, split on arg_separator
+            (at most maxsplit times, if it is not -1). Parsed arguments are cached, since players tend
+            to repeat the same commands.
+
+        Example: with name = 'get_state' and arg_separator = '#', 'get_state#jcampbell#repo' -> ('jcampbell', 'repo')
+        """
+        return split_args(command_text[len(self.name):], self.arg_separator, maxsplit)
+
+class CommandIndex:
+    """ Finds the chat command that matches a command text. The command names and aliases are stored in a
+        prefix trie, so that the lookup takes time proportional to the length of the command name, however
+        many commands there are; when several names prefix the text, the longest one wins (e.g., 'online'
+        before 'o'). A command is only found through a name or alias that prefixes the text.
+    """
+
+    def __init__(self, commands: list[ChatCommand]) -> None:
+        self.__commands: list[ChatCommand] = list(commands)
+        self.__root: dict = {}
+        for command in self.__commands:
+            for name in (command.name,) + tuple(command.aliases):
+                node = self.__root
+                for char in name.lower():
+                    node = node.setdefault(char, {})
+                node.setdefault(None, command) # the first command with a given name wins, as before
+
+    def get_commands(self) -> list[ChatCommand]:
+        """ Returns the indexed commands, in the order in which they were given. """
+        return list(self.__commands)
+
+    def find(self, command_text: str) -> Optional[ChatCommand]:
+        """ Returns the command that matches the (lowercase) command text, or None if there is none. """
+        candidates: list[ChatCommand] = []
+        node = self.__root
+        for char in command_text:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                candidates.append(node[None])
+        for command in reversed(candidates): # longest name first
+            if command.matches(command_text):
+                return command
+        return None
@@ -0,0 +1,53 @@
+import threading
+import traceback
+from typing import TYPE_CHECKING, Callable, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from .message import Message, ServerMessage
+
+if TYPE_CHECKING:
+    from maps.base import Map
+    from Player import HumanPlayer
+    from command import ChatCommand
+
+class CommandRunner:
+    """ Runs the blocking chat commands (see ChatCommand.blocking) on a bounded pool of threads, so that
+        a slow command (e.g., cloning a repository) does not hold up the messages of the other players.
+        The player gets an acknowledgement right away, and the messages returned by the command are passed
+        to the result handler (set by the backend) once it completes. Without a result handler, commands
+        run synchronously.
+    """
+    MAX_WORKERS = 4
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__result_handler: Optional[Callable[[list[Message]], None]] = None
+
+    def set_result_handler(self, result_handler: Optional[Callable[[list[Message]], None]]) -> None:
+        """ Set the function that receives the messages of the commands run in the background. """
+        self.__result_handler = result_handler
+
+    def run(self, command: "ChatCommand", command_text: str, context: "Map", player: "HumanPlayer") -> list[Message]:
+        """ Run the command in the background if it is blocking, returning its acknowledgement, or run it
+            right away and return its messages otherwise.
+        """
+        if not command.blocking or self.__result_handler is None:
+            return command.execute(command_text, context, player)
+
+        with self.__lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix='command')
+        self.__executor.submit(self.__run_in_background, command, command_text, context, player)
+        return [ServerMessage(player, command.get_acknowledgement(command_text))]
+
+    def __run_in_background(self, command: "ChatCommand", command_text: str, context: "Map", player: "HumanPlayer") -> None:
+        try:
+            messages = command.execute(command_text, context, player)
+        except:
+            messages = [ServerMessage(player, 'An error occurred processing your command: ' + traceback.format_exc())]
+        result_handler = self.__result_handler
+        if result_handler is not None:
+            result_handler(messages)
+
+command_runner = CommandRunner()
@@ -0,0 +1,103 @@
+import os
+import csv
+import time
+import threading
+from typing import Optional
+
+class CsvTable:
+    """ The rows of a CSV file, with a hash index on each column that has been searched. Tables are never
+        modified (the cache loads a new one when the file changes), so what is derived from them is cached.
+    """
+
+    def __init__(self, rows: list[dict[str, str]]) -> None:
+        self.__rows: list[dict[str, str]] = rows
+        self.__indexes: dict[str, dict[str, list[dict[str, str]]]] = {}
+        self.__value_sets: dict[str, frozenset[str]] = {}
+        self.__mappings: dict[tuple[str, str], dict[str, str]] = {}
+
+    def get_rows(self) -> list[dict[str, str]]:
+        return self.__rows
+
+    def __get_index(self, column: str) -> dict[str, list[dict[str, str]]]:
+        index = self.__indexes.get(column)
+        if index is None:
+            index = {}
+            for row in self.__rows:
+                index.setdefault(row.get(column), []).append(row)
+            self.__indexes[column] = index # built at most a few times if threads race, with the same result
+        return index
+
+    def find(self, column: str, value: str) -> list[dict[str, str]]:
+        """ Returns the rows whose column has the given value, in file order. """
+        return self.__get_index(column).get(value, [])
+
+    def find_one(self, column: str, value: str) -> Optional[dict[str, str]]:
+        """ Returns the last row whose column has the given value (later rows override earlier ones, as when
+            the rows are read into a dict), or None if there is none.
+        """
+        rows = self.find(column, value)
+        return rows[-1] if len(rows) > 0 else None
+
+    def get_values(self, column: str) -> list[str]:
+        """ Returns the distinct values of the column. """
+        return list(self.__get_index(column).keys())
+
+    def get_value_set(self, column: str) -> frozenset[str]:
+        """ Returns the distinct values of the column, without surrounding whitespace, for membership tests. """
+        value_set = self.__value_sets.get(column)
+        if value_set is None:
+            value_set = frozenset(value.strip() for value in self.get_values(column) if value is not None)
+            self.__value_sets[column] = value_set
+        return value_set
+
+    def get_mapping(self, key_column: str, value_column: str) -> dict[str, str]:
+        """ Returns the value of value_column for each value of key_column, as when the rows are read into a
+            dict (the last row wins). Do not modify the result, which is shared.
+        """
+        mapping = self.__mappings.get((key_column, value_column))
+        if mapping is None:
+            mapping = {row.get(key_column): row.get(value_column) for row in self.__rows}
+            self.__mappings[(key_column, value_column)] = mapping
+        return mapping
+
+class CsvTableCache:
+    """ Loads the CSV files that the commands look things up in (groups, review assignments, ...) once, and
+        again only when a file is modified; whether it was is checked at most every RELOAD_CHECK_INTERVAL
+        seconds, so that a burst of commands does not stat the file every time.
+    """
+    RELOAD_CHECK_INTERVAL = 2 # seconds
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__tables: dict[str, tuple[CsvTable, float, float]] = {} # (table, mtime, time of the last check) by path
+
+    def get_table(self, path: str, fieldnames: Optional[list[str]] = None) -> CsvTable:
+        """ Returns the table of the CSV file. Raises FileNotFoundError if there is no such file.
+
+        Arguments:
+            path: the path of the CSV file
+            fieldnames: the names of the columns, for files without a header row (None to read the header)
+        """
+        now = time.time()
+        with self.__lock:
+            cached = self.__tables.get(path)
+            if cached is not None and now - cached[2] < self.RELOAD_CHECK_INTERVAL:
+                return cached[0]
+
+        try:
+            mtime = os.path.getmtime(path)
+        except FileNotFoundError:
+            with self.__lock:
+                self.__tables.pop(path, None)
+            raise
+
+        if cached is None or cached[1] != mtime:
+            with open(path, newline='') as f:
+                table = CsvTable(list(csv.DictReader(f, fieldnames=fieldnames)))
+        else:
+            table = cached[0]
+        with self.__lock:
+            self.__tables[path] = (table, mtime, now)
+        return table
+
+csv_tables = CsvTableCache()
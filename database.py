@@ -1,8 +1,18 @@
+import os
 import sys
 
-if "client_local" in sys.argv[0]:
+# the backend can be chosen with the DATABASE environment variable (local, sqlite or remote)
+DATABASE = os.environ.get("DATABASE", "")
+
+if DATABASE == "sqlite":
+    from .database_sqlite import db
+elif DATABASE == "local":
+    from .database_local import db
+elif DATABASE == "remote":
+    from .database_remote import db
+elif "client_local" in sys.argv[0]:
     from .database_local import db
 elif any("server_remote" in arg for arg in sys.argv):
     from .database_remote import db
 else:
-    from .database_local import db
\ No newline at end of file
+    from .database_local import db
@@ -0,0 +1,90 @@
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Union
+
+from .audit_log import audit_log
+
+if TYPE_CHECKING:
+    from database_entity import DatabaseEntity
+
+class UserRecord:
+    """ A user stored in the database, as returned by get_all_users. It can be passed to
+        get_state/update_state in place of the corresponding HumanPlayer.
+    """
+
+    def __init__(self, name: str, email: str = "") -> None:
+        self.name: str = name
+        self.email: str = email
+
+    def get_name(self) -> str:
+        return self.name
+
+    def __repr__(self) -> str:
+        return f'UserRecord({self.name}, {self.email})'
+
+class BaseDatabase(ABC):
+    """ The interface shared by the database backends (see database.py). The state of each entity
+        (player, map, or NPC) is a dict, stored under the entity's type and name.
+    """
+    ENTITY_TYPES = ["HumanPlayer", "Map", "NPC", "JobQueue"]
+
+    def get_entity_type(self, obj: Union["DatabaseEntity", UserRecord]) -> str:
+        """ Returns the type under which the state of the object is stored. """
+        if isinstance(obj, UserRecord):
+            return "HumanPlayer"
+        class_hierarchy = [cls.__name__ for cls in obj.__class__.__mro__ if cls is not object]
+        for entity_type in self.ENTITY_TYPES:
+            if entity_type in class_hierarchy:
+                return entity_type
+        assert False, f"Could not find entity class for {type(obj)}"
+
+    @abstractmethod
+    def get_state(self, obj: Union["DatabaseEntity", UserRecord], table: str = "") -> dict:
+        """ Get the state of the object from the database. The table argument is ignored; it is only
+            accepted for compatibility with the remote database.
+        """
+        pass
+
+    def get_value(self, obj: Union["DatabaseEntity", UserRecord], key: str, default: Any = None) -> Any:
+        """ Get the value of one key in the state of the object, or default if it is not set. Backends
+            should override this to avoid reading (and copying) the whole state.
+        """
+        return self.get_state(obj).get(key, default)
+
+    @abstractmethod
+    def update_state(self, obj: Union["DatabaseEntity", UserRecord], state: dict, table: str = "") -> None:
+        """ Update the state of the object in the database. """
+        pass
+
+    @abstractmethod
+    def update_keys(self, obj: Union["DatabaseEntity", UserRecord], updates: dict, deletes: Iterable[str] = ()) -> None:
+        """ Set the given keys and delete the others in the state of the object, as a single atomic
+            change. Unlike update_state, the keys that are not mentioned are left as they are.
+        """
+        pass
+
+    @abstractmethod
+    def modify_value(self, obj: Union["DatabaseEntity", UserRecord], key: str, modify: Callable[[Any], Any], default: Any = None) -> Any:
+        """ Atomically replace the value of the key in the state of the object by modify(value), where value
+            is default if the key is not set. modify must return a new value rather than change the one it is
+            given. Returns the new value.
+        """
+        pass
+
+    def pin(self, obj: Union["DatabaseEntity", UserRecord]) -> None:
+        """ Hint that the state of the object is in active use (e.g., an online player or a room in memory),
+            so that a backend that caches states should keep it in memory until it is unpinned.
+        """
+        pass
+
+    def unpin(self, obj: Union["DatabaseEntity", UserRecord]) -> None:
+        """ Undo one call to pin. """
+        pass
+
+    @abstractmethod
+    def get_all_users(self) -> list[UserRecord]:
+        """ Returns all the users that have a state in the database. """
+        pass
+
+    def log(self, event: str, message: str, user: str = "") -> None:
+        """ Record an event (e.g., 'repo') of the user in the audit log. Returns without waiting for the write. """
+        audit_log.record(event, message, user)
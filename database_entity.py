@@ -1,25 +1,109 @@
-
-from typing import TypeVar
+import threading
+from typing import Any, Callable, TypeVar, Iterator, Optional
+from contextlib import contextmanager
 from abc import ABC, abstractmethod
 
 from .database import db
 
+# the changes made inside a transaction, by thread then by entity (see DatabaseEntity.transaction)
+_transactions = threading.local()
+# the pending change of a key that is deleted in a transaction
+_DELETED = object()
+
 class DatabaseEntity(ABC):
     @abstractmethod
     def get_name(self) -> str:
         """ Returns the name of the entity. """
         pass
 
+    def __get_pending_changes(self) -> Optional[dict]:
+        pending = getattr(_transactions, 'pending', {})
+        return pending.get(id(self))
+
     T = TypeVar('T')
     def get_state(self, key: str, default: T = 0) -> T:
         """ Get the state for the given key. """
-        state = db.get_state(self)
-        if key in state:
-            return state[key]
-        return default
+        changes = self.__get_pending_changes()
+        if changes is not None and key in changes:
+            return default if changes[key] is _DELETED else changes[key]
+        return db.get_value(self, key, default) # copies only this value, not the whole state
+
+    def get_full_state(self) -> dict:
+        """ Returns a copy of the whole state (e.g., to find the keys that are set), without the pending changes. """
+        return db.get_state(self)
 
     def set_state(self, key: str, value : T) -> None:
-        """ Set the state for the given key, updating the database. """
-        state = db.get_state(self)
-        state[key] = value
-        db.update_state(self, state) # update database
\ No newline at end of file
+        """ Set the state for the given key, updating the database (or, inside a transaction, when it ends). """
+        changes = self.__get_pending_changes()
+        if changes is not None:
+            changes[key] = value
+            return
+        db.update_keys(self, {key: value}) # update database
+
+    def delete_state(self, key: str) -> None:
+        """ Delete the state for the given key, if it is set (inside a transaction, when it ends). """
+        changes = self.__get_pending_changes()
+        if changes is not None:
+            changes[key] = _DELETED
+            return
+        db.update_keys(self, {}, deletes=(key,))
+
+    def modify_state(self, key: str, modify: Callable[[Any], Any], default: Any = None) -> Any:
+        """ Atomically replace the state for the given key by modify(value), where value is default if the
+            key is not set. modify must return a new value rather than change the one it is given.
+            Returns the new value.
+        """
+        changes = self.__get_pending_changes()
+        if changes is not None:
+            changes[key] = modify(self.get_state(key, default))
+            return changes[key]
+        return db.modify_value(self, key, modify, default)
+
+    def increment(self, key: str, amount: int = 1) -> int:
+        """ Add amount to the number stored at key (0 if unset). Returns the new number. """
+        return self.modify_state(key, lambda value: value + amount, 0)
+
+    def append(self, key: str, item: Any) -> list:
+        """ Append item to the list stored at key (empty if unset). Returns the new list. """
+        return self.modify_state(key, lambda value: value + [item], [])
+
+    def add_to_set(self, key: str, item: Any) -> list:
+        """ Append item to the list stored at key, unless it is already in it. Returns the new list. """
+        return self.modify_state(key, lambda value: value if item in value else value + [item], [])
+
+    def remove(self, key: str, item: Any) -> list:
+        """ Remove the first occurrence of item from the list stored at key, if any. Returns the new list. """
+        def remove_item(value: list) -> list:
+            if item not in value:
+                return value
+            index = value.index(item)
+            return value[:index] + value[index+1:]
+        return self.modify_state(key, remove_item, [])
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """ Group the set_state and delete_state calls made in the with block into a single atomic write to the database,
+            made when the block ends. get_state sees the pending values. If the block raises an exception,
+            none of its changes are written. Transactions are per thread, and nested ones join the outer one.
+
+        Example:
+            with player.transaction():
+                player.set_state('repo', [repo_user, repo_name])
+                player.set_state('branch', branch)
+        """
+        if not hasattr(_transactions, 'pending'):
+            _transactions.pending = {}
+        pending: dict[int, dict] = _transactions.pending
+        if id(self) in pending:
+            yield
+            return
+
+        pending[id(self)] = {}
+        try:
+            yield
+            changes = pending[id(self)]
+        finally:
+            del pending[id(self)]
+        if len(changes) > 0:
+            updates = {key: value for key, value in changes.items() if value is not _DELETED}
+            db.update_keys(self, updates, deletes=[key for key, value in changes.items() if value is _DELETED])
@@ -1,46 +1,439 @@
-import os, pickle
-from typing import TYPE_CHECKING
+import os, copy, time, zlib, atexit, pickle, struct, threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Iterable, Iterator, Optional
+
+from .database_base import BaseDatabase, UserRecord
 
 if TYPE_CHECKING:
     from database_entity import DatabaseEntity
 
-class Database:
+# State files are made of records: a header (name length, data length, CRC32 of name and data),
+# followed by the entity name (UTF-8) and the pickled data. A snapshot holds one record per entity
+# with its full state; its journal holds one record per change with the (updated keys, deleted keys).
+RECORD_HEADER = struct.Struct(">III")
+SNAPSHOT_MAGIC = b"MUDSNAP1"
+
+def write_record(f: BinaryIO, name: str, data: bytes) -> None:
+    name_b = name.encode("utf-8")
+    f.write(RECORD_HEADER.pack(len(name_b), len(data), zlib.crc32(name_b + data)) + name_b + data)
+
+def read_records(f: BinaryIO) -> Iterator[tuple[int, str, bytes]]:
+    """ Yields (offset, name, data) for each record until the end of the file, or until a record
+        that is incomplete or corrupt (e.g., because of a crash in the middle of a write).
+    """
+    while True:
+        offset = f.tell()
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        name_len, data_len, crc = RECORD_HEADER.unpack(header)
+        body = f.read(name_len + data_len)
+        if len(body) < name_len + data_len or zlib.crc32(body) != crc:
+            print(f"Ignoring incomplete record at offset {offset} of {f.name}")
+            f.seek(offset)
+            return
+        yield offset, body[:name_len].decode("utf-8"), body[name_len:]
+
+def fsync_dir(path: str) -> None:
+    """ Make sure that the renames in the directory of the file are on disk. """
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def get_value_sizes(state: dict) -> dict[str, int]:
+    """ Returns the pickled size of each value of the state, in bytes. """
+    return {key: len(pickle.dumps(value)) for key, value in state.items()}
+
+class CachedState:
+    """ The state of an entity kept in memory, with the approximate size of each of its values. """
+
+    def __init__(self, state: dict, sizes: dict[str, int]) -> None:
+        self.state: dict = state
+        self.sizes: dict[str, int] = sizes
+        self.size: int = sum(sizes.values())
+
+class Database(BaseDatabase):
     MAPPING = {
         "HumanPlayer": ("user_state.pkl", False),
         "Map": ("map_state.pkl", True),
         "NPC": ("npc_state.pkl", True),
+        "JobQueue": ("job_state.pkl", True),
     }
+    SYNC_INTERVAL = 5 # seconds between syncs of the journals to disk
+    LOCK_STRIPES = 64 # number of locks shared by the entities for their writes
+    COMPACT_JOURNAL_SIZE = 1 << 20 # journal size in bytes beyond which it is compacted into the snapshot
+    MAX_RESIDENT_BYTES = 64 << 20 # approximate size of the states kept in memory, per file
+    MAX_RESIDENT_STATE_BYTES = 4 << 20 # states larger than this are only kept in memory while needed
 
     def __init__(self) -> None:
-        for filename, _ in self.MAPPING.values():
-            if not os.path.exists(filename):
-                with open(filename, "wb") as f:
-                    pickle.dump({}, f)
+        # the states of the entities are cached in memory, by filename then entity name, in least recently
+        # used order. a state that is not cached is read from the snapshot, which is indexed by entity name.
+        # each change is appended to the file's journal, and the changed state stays in memory (dirty) until
+        # the journal is compacted into the snapshot; then it can be evicted when the cache is over its size
+        # limit, unless it is pinned (e.g., the state of an online player or of a room in memory). files are
+        # only opened when the database is first used, so that processes that merely import this module
+        # (e.g., room builders) never touch them.
+        #
+        # cached states are never modified in place (a write caches a new dict). writes to the same entity
+        # are serialized by one of the stripe locks, which unrelated entities rarely share. each file has a
+        # lock for its journal, one for its cache and one for its snapshot, which are only held briefly.
+        self.__stripes = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self.__journal_locks: dict[str, threading.Lock] = {filename: threading.Lock() for filename, _ in self.MAPPING.values()}
+        self.__cache_locks: dict[str, threading.Lock] = {filename: threading.Lock() for filename, _ in self.MAPPING.values()}
+        self.__snapshot_locks: dict[str, threading.Lock] = {filename: threading.Lock() for filename, _ in self.MAPPING.values()}
+        self.__compact_lock = threading.Lock()
+
+        self.__cache: dict[str, OrderedDict[str, CachedState]] = {}
+        self.__cache_sizes: dict[str, int] = {}
+        self.__dirty: dict[str, set[str]] = {}
+        self.__pinned: dict[str, dict[str, int]] = {filename: {} for filename, _ in self.MAPPING.values()}
+        self.__index: dict[str, dict[str, tuple[int, int]]] = {} # (offset, length) of each record of the snapshots
+        self.__journals: dict[str, BinaryIO] = {}
+        self.__unsynced: set[str] = set()
+        self.__opened: bool = False
+
+    def __ensure_open(self) -> None:
+        if self.__opened:
+            return
+        with self.__compact_lock:
+            if self.__opened:
+                return
+            for filename, _ in self.MAPPING.values():
+                self.__open(filename)
+            self.__opened = True
+
+            self.__maintenance_t = threading.Thread(target=self.__maintenance_loop, daemon=True)
+            self.__maintenance_t.start()
+            atexit.register(self.close)
+
+    def __open(self, filename: str) -> None:
+        self.__cache[filename] = OrderedDict()
+        self.__cache_sizes[filename] = 0
+        self.__dirty[filename] = set()
+        self.__index[filename] = {}
+
+        needs_compaction = False
+        if os.path.exists(filename):
+            with open(filename, "rb") as f:
+                if f.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC:
+                    for offset, name, _ in read_records(f):
+                        self.__index[filename][name] = (offset, f.tell() - offset)
+                else: # a plain pickled dict, as written by older versions
+                    f.seek(0)
+                    for name, state in pickle.load(f).items():
+                        self.__store(filename, name, state, get_value_sizes(state))
+                    needs_compaction = True
+
+        # a leftover .old journal means that the last compaction did not complete
+        if os.path.exists(filename + ".journal.old"):
+            with open(filename + ".journal.old", "rb") as f:
+                self.__replay(f, filename)
+            needs_compaction = True
+
+        journal = open(filename + ".journal", "a+b")
+        journal.seek(0)
+        self.__replay(journal, filename)
+        journal.truncate() # drop an incomplete record at the end, if any
+
+        self.__journals[filename] = journal
+        if needs_compaction:
+            self.__compact(filename)
+
+    def __replay(self, f: BinaryIO, filename: str) -> None:
+        for _, name, change in read_records(f):
+            updates, deletes = pickle.loads(change)
+            cached = self.__get_cached(filename, name)
+            state = dict(cached.state) if cached is not None else {}
+            sizes = dict(cached.sizes) if cached is not None else {}
+            state.update(updates)
+            sizes.update(get_value_sizes(updates))
+            for key in deletes:
+                state.pop(key, None)
+                sizes.pop(key, None)
+            self.__store(filename, name, state, sizes)
 
     def get_data_for_object(self, obj: "DatabaseEntity"):
-        class_hierarchy = [cls.__name__ for cls in obj.__class__.__mro__ if cls is not object]
-        for entity_type, data in self.MAPPING.items():
-            if str(entity_type) in class_hierarchy:
-                return data
-        assert False, f"Could not find entity class for {type(obj)}"
+        return self.MAPPING[self.get_entity_type(obj)]
+
+    def __get_stripe(self, filename: str, name: str) -> threading.Lock:
+        return self.__stripes[hash((filename, name)) % len(self.__stripes)]
+
+    def __touch(self, filename: str, name: str) -> Optional[CachedState]:
+        # returns the cached state of the entity, if any, marking it as the most recently used
+        with self.__cache_locks[filename]:
+            cached = self.__cache[filename].get(name)
+            if cached is not None:
+                self.__cache[filename].move_to_end(name)
+            return cached
+
+    def __read_snapshot(self, filename: str, name: str) -> Optional[dict]:
+        with self.__snapshot_locks[filename]:
+            if name not in self.__index[filename]:
+                return None
+            offset, length = self.__index[filename][name]
+            with open(filename, "rb") as f:
+                f.seek(offset)
+                _, _, data = next(read_records(f))
+        return pickle.loads(data)
+
+    def __get_cached(self, filename: str, name: str) -> Optional[CachedState]:
+        # returns the state of the entity, reading it from the snapshot if it is not cached. must be called
+        # with the stripe lock of the entity held, so that it never caches a state older than a concurrent write
+        cached = self.__touch(filename, name)
+        if cached is not None:
+            return cached
+        state = self.__read_snapshot(filename, name)
+        if state is None:
+            return None
+        cached = CachedState(state, get_value_sizes(state))
+        with self.__cache_locks[filename]:
+            self.__cache[filename][name] = cached
+            self.__cache_sizes[filename] += cached.size
+        return cached
+
+    def __store(self, filename: str, name: str, state: dict, sizes: dict[str, int]) -> None:
+        cached = CachedState(state, sizes)
+        with self.__cache_locks[filename]:
+            old_cached = self.__cache[filename].pop(name, None)
+            if old_cached is not None:
+                self.__cache_sizes[filename] -= old_cached.size
+            self.__cache[filename][name] = cached
+            self.__cache_sizes[filename] += cached.size
+            self.__dirty[filename].add(name)
+
+    def __evict(self, filename: str, all_large: bool = False) -> None:
+        """ Drop the least recently used states that are clean (i.e., that are in the snapshot) and not pinned,
+            until the cache is within its size limit. If all_large is True, also drop all such states that are
+            over the size limit of a single state.
+        """
+        with self.__cache_locks[filename]:
+            cache, dirty, pinned = self.__cache[filename], self.__dirty[filename], self.__pinned[filename]
+            if self.__cache_sizes[filename] <= self.MAX_RESIDENT_BYTES and not all_large:
+                return
+            evicted = []
+            cache_size = self.__cache_sizes[filename]
+            for name, cached in cache.items(): # least recently used first
+                if cache_size <= self.MAX_RESIDENT_BYTES and not all_large:
+                    break
+                if name in dirty or name in pinned:
+                    continue
+                if cache_size > self.MAX_RESIDENT_BYTES or cached.size > self.MAX_RESIDENT_STATE_BYTES:
+                    evicted.append(name)
+                    cache_size -= cached.size
+            for name in evicted:
+                del cache[name]
+            self.__cache_sizes[filename] = cache_size
 
-    def get_state(self, obj: "DatabaseEntity") -> dict:
+    def __read(self, obj: "DatabaseEntity") -> Optional[CachedState]:
+        # returns the cached state of the object (None if it has none), reading it from the snapshot if needed.
+        # cached states are never modified in place, so the caller can copy from it after it was evicted
+        filename, _ = self.get_data_for_object(obj)
+        self.__ensure_open()
+        cached = self.__touch(filename, obj.get_name())
+        if cached is None:
+            with self.__get_stripe(filename, obj.get_name()):
+                cached = self.__get_cached(filename, obj.get_name())
+            if cached is not None:
+                self.__evict(filename, all_large=cached.size > self.MAX_RESIDENT_STATE_BYTES)
+        return cached
+
+    def get_state(self, obj: "DatabaseEntity", table: str = "") -> dict:
         """ Get the state of the object from the database.. """
+        cached = self.__read(obj)
+        return copy.deepcopy(cached.state) if cached is not None else {}
+
+    def get_value(self, obj: "DatabaseEntity", key: str, default: Any = None) -> Any:
+        """ Get the value of one key in the state of the object (only that value is copied). """
+        cached = self.__read(obj)
+        if cached is None or key not in cached.state:
+            return default
+        return copy.deepcopy(cached.state[key])
+
+    def update_state(self, obj: "DatabaseEntity", state: dict, table: str = "") -> None:
+        """ Update the state of the object in the database. Only the keys that changed are written to disk. """
+        filename, _ = self.get_data_for_object(obj)
+        state = copy.deepcopy(state)
+        self.__ensure_open()
+        with self.__get_stripe(filename, obj.get_name()):
+            cached = self.__get_cached(filename, obj.get_name())
+            old_state = cached.state if cached is not None else {}
+            updates = {key: value for key, value in state.items() if key not in old_state or old_state[key] != value}
+            deletes = [key for key in old_state if key not in state]
+            self.__write_change(filename, obj.get_name(), cached, updates, deletes)
+        self.__evict(filename)
+
+    def update_keys(self, obj: "DatabaseEntity", updates: dict, deletes: Iterable[str] = ()) -> None:
+        """ Set the given keys and delete the others in the state of the object, as a single change. """
         filename, _ = self.get_data_for_object(obj)
-        with open(filename, "rb") as f:
-            data = pickle.load(f)
-        return data.get(obj.get_name(), {})
-    
-    def update_state(self, obj: "DatabaseEntity", state: dict) -> None:
-        """ Update the state of the object in the database. """
+        updates = copy.deepcopy(updates)
+        self.__ensure_open()
+        with self.__get_stripe(filename, obj.get_name()):
+            cached = self.__get_cached(filename, obj.get_name())
+            old_state = cached.state if cached is not None else {}
+            deletes = [key for key in deletes if key in old_state and key not in updates]
+            self.__write_change(filename, obj.get_name(), cached, updates, deletes)
+        self.__evict(filename)
+
+    def modify_value(self, obj: "DatabaseEntity", key: str, modify: Callable[[Any], Any], default: Any = None) -> Any:
+        """ Atomically replace the value of the key by modify(value) (see BaseDatabase.modify_value). """
+        filename, _ = self.get_data_for_object(obj)
+        self.__ensure_open()
+        with self.__get_stripe(filename, obj.get_name()):
+            cached = self.__get_cached(filename, obj.get_name())
+            old_state = cached.state if cached is not None else {}
+            value = copy.deepcopy(modify(old_state.get(key, default)))
+            if not (key in old_state and old_state[key] == value):
+                self.__write_change(filename, obj.get_name(), cached, {key: value}, [])
+        self.__evict(filename)
+        return copy.deepcopy(value)
+
+    def __write_change(self, filename: str, name: str, cached: Optional[CachedState], updates: dict, deletes: list[str]) -> None:
+        # must be called with the stripe lock of the entity held, so that the changes to an entity
+        # are journaled in the order in which they are applied
+        if len(updates) == 0 and len(deletes) == 0:
+            return
+        state = {key: value for key, value in cached.state.items() if key not in deletes} if cached is not None else {}
+        state.update(updates)
+        sizes = {key: size for key, size in cached.sizes.items() if key not in deletes} if cached is not None else {}
+        sizes.update(get_value_sizes(updates))
+
+        change = pickle.dumps((updates, deletes))
+        self.__store(filename, name, state, sizes)
+        with self.__journal_locks[filename]:
+            journal = self.__journals[filename]
+            write_record(journal, name, change)
+            journal.flush()
+            self.__unsynced.add(filename)
+
+    def pin(self, obj: "DatabaseEntity") -> None:
+        """ Keep the state of the object in memory until it is unpinned (as many times as it was pinned). """
         filename, _ = self.get_data_for_object(obj)
-        with open(filename, "rb") as f:
-            data = pickle.load(f)
-        data[obj.get_name()] = state
-        with open(filename, "wb") as f:
-            pickle.dump(data, f)
-    
-    def log(self, email, message):
-        print("LOCAL DB LOG", email, message)
-
-db = Database()
\ No newline at end of file
+        with self.__cache_locks[filename]:
+            pinned = self.__pinned[filename]
+            pinned[obj.get_name()] = pinned.get(obj.get_name(), 0) + 1
+
+    def unpin(self, obj: "DatabaseEntity") -> None:
+        """ Allow the state of the object to be evicted from memory again. """
+        filename, _ = self.get_data_for_object(obj)
+        with self.__cache_locks[filename]:
+            pinned = self.__pinned[filename]
+            if pinned.get(obj.get_name(), 0) > 1:
+                pinned[obj.get_name()] -= 1
+            else:
+                pinned.pop(obj.get_name(), None)
+
+    def get_all_users(self) -> list[UserRecord]:
+        """ Returns all the users that have a state in the database. """
+        filename, _ = self.MAPPING["HumanPlayer"]
+        self.__ensure_open()
+        with self.__cache_locks[filename]:
+            cached = dict(self.__cache[filename])
+        with self.__snapshot_locks[filename]:
+            names = set(self.__index[filename]) | set(cached)
+        users = []
+        for name in sorted(names):
+            # states that are not cached are read without caching them, to keep the cache for the active players
+            state = cached[name].state if name in cached else self.__read_snapshot(filename, name)
+            users.append(UserRecord(name, (state or {}).get('email', '')))
+        return users
+
+    def sync(self) -> None:
+        """ Make sure that the journal entries written so far are on disk. """
+        with self.__compact_lock:
+            unsynced = []
+            for filename, journal_lock in self.__journal_locks.items():
+                with journal_lock:
+                    if filename in self.__unsynced:
+                        self.__unsynced.discard(filename)
+                        unsynced.append(self.__journals[filename])
+            for journal in unsynced:
+                os.fsync(journal.fileno())
+
+    def compact(self, filename: str) -> None:
+        """ Write the full state of the file into a new snapshot and empty its journal. """
+        self.__ensure_open()
+        with self.__compact_lock:
+            self.__compact(filename)
+
+    def __compact(self, filename: str) -> None:
+        with self.__journal_locks[filename]:
+            # cached states are replaced (never modified in place), so a shallow copy is a consistent snapshot.
+            # a change stored just before the copy may still be journaled after the rotation, which is
+            # harmless: replaying it sets the same values again.
+            with self.__cache_locks[filename]:
+                cached = dict(self.__cache[filename])
+                dirty = set(self.__dirty[filename])
+            journal = self.__journals[filename]
+            if os.path.exists(filename + ".journal.old"):
+                # the last compaction did not complete, so the old journal may hold changes that are not in the
+                # snapshot yet: the journal is appended to it (and made durable) rather than replacing it
+                with open(filename + ".journal.old", "r+b") as old_journal:
+                    for _ in read_records(old_journal):
+                        pass
+                    old_journal.truncate() # drop an incomplete record at the end, if any
+                    journal.seek(0)
+                    for _, name, change in read_records(journal):
+                        write_record(old_journal, name, change)
+                    old_journal.flush()
+                    os.fsync(old_journal.fileno())
+                journal.seek(0)
+                journal.truncate()
+            else:
+                journal.close()
+                os.replace(filename + ".journal", filename + ".journal.old")
+                self.__journals[filename] = open(filename + ".journal", "a+b")
+            self.__unsynced.discard(filename)
+
+        # only the snapshots write the index, and they are serialized by the compaction lock
+        old_index = self.__index[filename]
+        new_index: dict[str, tuple[int, int]] = {}
+        old_snapshot = open(filename, "rb") if len(old_index) > 0 else None
+        with open(filename + ".tmp", "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+            for name in list(old_index) + [name for name in cached if name not in old_index]:
+                offset = f.tell()
+                if name in dirty:
+                    write_record(f, name, pickle.dumps(cached[name].state))
+                else: # unchanged since the last snapshot, so the record is copied as it is
+                    old_offset, length = old_index[name]
+                    old_snapshot.seek(old_offset)
+                    f.write(old_snapshot.read(length))
+                new_index[name] = (offset, f.tell() - offset)
+            f.flush()
+            os.fsync(f.fileno())
+        if old_snapshot is not None:
+            old_snapshot.close()
+
+        with self.__snapshot_locks[filename]:
+            os.replace(filename + ".tmp", filename)
+            self.__index[filename] = new_index
+        fsync_dir(filename) # the new snapshot must be in place before the old journal is gone
+        os.remove(filename + ".journal.old")
+
+        # the states that were written are now clean, unless they changed in the meantime
+        with self.__cache_locks[filename]:
+            for name in dirty:
+                if self.__cache[filename].get(name) is cached[name]:
+                    self.__dirty[filename].discard(name)
+        self.__evict(filename, all_large=True)
+
+    def close(self) -> None:
+        """ Compact all journals; called on exit. """
+        for filename in self.__journals:
+            if os.path.getsize(filename + ".journal") > 0:
+                self.compact(filename)
+
+    def __maintenance_loop(self) -> None:
+        while True:
+            time.sleep(self.SYNC_INTERVAL)
+            self.sync()
+            for filename in self.__journals:
+                # dirty states cannot be evicted, so the journal is also compacted when they fill the cache
+                with self.__cache_locks[filename]:
+                    dirty_size = sum(self.__cache[filename][name].size for name in self.__dirty[filename])
+                if os.path.getsize(filename + ".journal") > self.COMPACT_JOURNAL_SIZE or dirty_size > self.MAX_RESIDENT_BYTES // 2:
+                    self.compact(filename)
+
+db = Database()
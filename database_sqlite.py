@@ -0,0 +1,127 @@
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, Union
+
+from .database_base import BaseDatabase, UserRecord
+
+if TYPE_CHECKING:
+    from database_entity import DatabaseEntity
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    id INTEGER PRIMARY KEY,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    UNIQUE (type, name)
+);
+CREATE INDEX IF NOT EXISTS entities_name ON entities (name);
+CREATE TABLE IF NOT EXISTS state (
+    entity_id INTEGER NOT NULL REFERENCES entities (id),
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (entity_id, key)
+) WITHOUT ROWID;
+"""
+
+# the statements are constant strings, so that sqlite3 compiles each of them once per connection
+# and then reuses it from its statement cache
+SELECT_STATE = "SELECT state.key, state.value FROM entities JOIN state ON state.entity_id = entities.id WHERE entities.type = ? AND entities.name = ?"
+SELECT_ENTITY = "SELECT id FROM entities WHERE type = ? AND name = ?"
+INSERT_ENTITY = "INSERT OR IGNORE INTO entities (type, name) VALUES (?, ?)"
+SELECT_VALUES = "SELECT key, value FROM state WHERE entity_id = ?"
+SELECT_VALUE = "SELECT value FROM state WHERE entity_id = ? AND key = ?"
+SELECT_ENTITY_VALUE = "SELECT state.value FROM entities JOIN state ON state.entity_id = entities.id WHERE entities.type = ? AND entities.name = ? AND state.key = ?"
+UPSERT_VALUE = "INSERT INTO state (entity_id, key, value) VALUES (?, ?, ?) ON CONFLICT (entity_id, key) DO UPDATE SET value = excluded.value"
+DELETE_VALUE = "DELETE FROM state WHERE entity_id = ? AND key = ?"
+SELECT_USERS = "SELECT entities.name, state.value FROM entities LEFT JOIN state ON state.entity_id = entities.id AND state.key = 'email' WHERE entities.type = 'HumanPlayer'"
+
+class Database(BaseDatabase):
+    """ Stores the state of every entity in a SQLite database, one row per (entity, key) with the value
+        encoded as JSON. The database is in WAL mode, so that readers never block the (single) writer,
+        and each thread uses its own connection. Select it by setting the DATABASE environment variable
+        to sqlite (see database.py).
+    """
+    PATH = os.environ.get("DATABASE_PATH", "state.sqlite3")
+    BUSY_TIMEOUT = 30 # seconds to wait for another writer before giving up
+
+    def __init__(self, path: str = PATH) -> None:
+        self.__path: str = path
+        self.__local = threading.local()
+        self.__schema_lock = threading.Lock()
+        self.__schema_created: bool = False
+
+    def __get_connection(self) -> sqlite3.Connection:
+        # the connection is opened on first use, so that merely importing this module creates no file
+        connection = getattr(self.__local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.__path, timeout=self.BUSY_TIMEOUT, isolation_level=None)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute("PRAGMA foreign_keys = ON")
+            with self.__schema_lock:
+                if not self.__schema_created:
+                    connection.executescript(SCHEMA)
+                    self.__schema_created = True
+            self.__local.connection = connection
+        return connection
+
+    def get_state(self, obj: Union["DatabaseEntity", UserRecord], table: str = "") -> dict:
+        """ Get the state of the object from the database. """
+        rows = self.__get_connection().execute(SELECT_STATE, (self.get_entity_type(obj), obj.get_name())).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def get_value(self, obj: Union["DatabaseEntity", UserRecord], key: str, default: Any = None) -> Any:
+        """ Get the value of one key in the state of the object, or default if it is not set. """
+        row = self.__get_connection().execute(SELECT_ENTITY_VALUE, (self.get_entity_type(obj), obj.get_name(), key)).fetchone()
+        return json.loads(row[0]) if row is not None else default
+
+    def update_state(self, obj: Union["DatabaseEntity", UserRecord], state: dict, table: str = "") -> None:
+        """ Update the state of the object in the database. Only the keys that changed are written. """
+        new_values = {key: json.dumps(value) for key, value in state.items()}
+        with self.__write(obj) as (connection, entity_id):
+            old_values = dict(connection.execute(SELECT_VALUES, (entity_id,)).fetchall())
+            connection.executemany(UPSERT_VALUE, [
+                (entity_id, key, value) for key, value in new_values.items() if old_values.get(key) != value
+            ])
+            connection.executemany(DELETE_VALUE, [(entity_id, key) for key in old_values if key not in new_values])
+
+    def update_keys(self, obj: Union["DatabaseEntity", UserRecord], updates: dict, deletes: Iterable[str] = ()) -> None:
+        """ Set the given keys and delete the others in the state of the object, as a single change. """
+        new_values = [(key, json.dumps(value)) for key, value in updates.items()]
+        with self.__write(obj) as (connection, entity_id):
+            connection.executemany(UPSERT_VALUE, [(entity_id, key, value) for key, value in new_values])
+            connection.executemany(DELETE_VALUE, [(entity_id, key) for key in deletes if key not in updates])
+
+    def modify_value(self, obj: Union["DatabaseEntity", UserRecord], key: str, modify: Callable[[Any], Any], default: Any = None) -> Any:
+        """ Atomically replace the value of the key by modify(value) (see BaseDatabase.modify_value). """
+        with self.__write(obj) as (connection, entity_id):
+            row = connection.execute(SELECT_VALUE, (entity_id, key)).fetchone()
+            value = json.dumps(modify(json.loads(row[0]) if row is not None else default))
+            connection.execute(UPSERT_VALUE, (entity_id, key, value))
+        return json.loads(value) # as stored (e.g., tuples become lists), like what get_state returns later
+
+    @contextmanager
+    def __write(self, obj: Union["DatabaseEntity", UserRecord]) -> Iterator[tuple[sqlite3.Connection, int]]:
+        # a write transaction on the state of the object; BEGIN IMMEDIATE takes the write lock up front,
+        # so that the values read inside the transaction cannot be changed by another connection
+        entity_type, name = self.get_entity_type(obj), obj.get_name()
+        connection = self.__get_connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(INSERT_ENTITY, (entity_type, name))
+            entity_id, = connection.execute(SELECT_ENTITY, (entity_type, name)).fetchone()
+            yield connection, entity_id
+            connection.execute("COMMIT")
+        except:
+            connection.execute("ROLLBACK")
+            raise
+
+    def get_all_users(self) -> list[UserRecord]:
+        """ Returns all the users that have a state in the database. """
+        rows = self.__get_connection().execute(SELECT_USERS).fetchall()
+        return [UserRecord(name, json.loads(email) if email is not None else "") for name, email in rows]
+
+db = Database()
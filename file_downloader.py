@@ -0,0 +1,84 @@
+import os
+import time
+import hashlib
+import threading
+import traceback
+from queue import Queue
+from typing import NoReturn, Optional
+
+import requests
+
+class FileDownloader:
+    """ Downloads files in a background thread, one at a time, streaming them to disk in chunks. An interrupted
+        download is resumed where it stopped (with a range request), and a file that is already on disk
+        with the expected hash is not downloaded again.
+    """
+    CHUNK_SIZE = 1 << 16
+    MAX_ATTEMPTS = 5
+    TIMEOUT = 30 # seconds without data before an attempt fails
+
+    def __init__(self) -> None:
+        self.__queue: Queue = Queue()
+        self.__thread = None
+
+    def download(self, url: str, dest: str, size: Optional[int] = None, sha256: Optional[str] = None) -> None:
+        """ Queue the download of url into the file dest. """
+        self.__queue.put((url, dest, size, sha256))
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__download_loop, daemon=True)
+            self.__thread.start()
+
+    def __download_loop(self) -> NoReturn:
+        while True:
+            url, dest, size, sha256 = self.__queue.get()
+            try:
+                self.download_now(url, dest, size, sha256)
+            except:
+                print(f"Could not download {url}:\n{traceback.format_exc()}")
+
+    def __hash_file(self, path: str) -> str:
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def download_now(self, url: str, dest: str, size: Optional[int] = None, sha256: Optional[str] = None) -> None:
+        """ Download url into the file dest in the calling thread. Raises an exception if it fails.
+
+        Arguments:
+            size: the size of the file in bytes, if known
+            sha256: the SHA-256 hash of the file, if known, to verify the download
+        """
+        if sha256 is not None and os.path.exists(dest) and self.__hash_file(dest) == sha256:
+            print(f"{dest} is already downloaded")
+            return
+
+        part_path = dest + '.part'
+        for attempt in range(self.MAX_ATTEMPTS):
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            if size is not None and offset > size: # left over from another version of the file
+                offset = 0
+            headers = {'Range': f'bytes={offset}-'} if offset > 0 else {}
+            try:
+                with requests.get(url, headers=headers, stream=True, timeout=self.TIMEOUT) as response:
+                    if response.status_code == 416 and offset > 0: # nothing left to download
+                        break
+                    if response.status_code not in (200, 206):
+                        raise Exception(f"Could not load {url} from server. Status code: {response.status_code}")
+                    # the server sends the whole file (200) if it does not support ranges
+                    with open(part_path, 'ab' if response.status_code == 206 else 'wb') as f:
+                        for chunk in response.iter_content(self.CHUNK_SIZE):
+                            f.write(chunk)
+                break
+            except requests.RequestException:
+                print(f"Download of {url} interrupted (attempt {attempt+1}/{self.MAX_ATTEMPTS}):\n{traceback.format_exc()}")
+                time.sleep(2 ** attempt)
+        else:
+            raise Exception(f"Could not download {url} after {self.MAX_ATTEMPTS} attempts.")
+
+        if sha256 is not None and self.__hash_file(part_path) != sha256:
+            os.remove(part_path) # corrupted, so start over next time
+            raise Exception(f"The download of {url} is corrupted (hash mismatch).")
+        os.replace(part_path, dest)
+        print(f"Downloaded {url} to {dest}")
@@ -0,0 +1,130 @@
+import os
+import re
+import hashlib
+import threading
+from typing import Optional
+from urllib.parse import unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from .resources import get_resource_path
+
+class FileServer:
+    """ Serves the resource files that FileMessages point to over HTTP, standing in locally for the remote
+        host. Range requests are supported, so that clients can download files in chunks and resume
+        interrupted downloads. The SHA-256 hash of each file is computed once (until the file changes),
+        so that FileMessages can carry it and clients can verify and skip files.
+    """
+    HOST = '127.0.0.1'
+    PORT = int(os.environ.get('FILE_SERVER_PORT', '0')) # 0 for any free port
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__server: Optional[ThreadingHTTPServer] = None
+        self.__file_infos: dict[str, tuple[float, int, str]] = {} # (mtime, size, hash) by path
+
+    def start(self) -> None:
+        """ Start serving in a background thread (if not already started). """
+        with self.__lock:
+            if self.__server is not None:
+                return
+            self.__server = ThreadingHTTPServer((self.HOST, self.PORT), _FileRequestHandler)
+            self.__server.daemon_threads = True
+            threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        """ Stop serving (if started). """
+        with self.__lock:
+            server, self.__server = self.__server, None
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    def get_base_url(self) -> Optional[str]:
+        """ Returns the URL that file paths are relative to, or None if the server is not running. """
+        if self.__server is None:
+            return None
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def get_file_info(self, file_path: str) -> Optional[tuple[int, str]]:
+        """ Returns the size and SHA-256 hash of the resource file, or None if there is no such file. """
+        path = get_resource_path(file_path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        with self.__lock:
+            cached = self.__file_infos.get(path)
+        if cached is not None and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+            return cached[1], cached[2]
+
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b''):
+                sha256.update(chunk)
+        with self.__lock:
+            self.__file_infos[path] = (stat.st_mtime, stat.st_size, sha256.hexdigest())
+        return stat.st_size, sha256.hexdigest()
+
+class _FileRequestHandler(BaseHTTPRequestHandler):
+    RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+    def do_HEAD(self) -> None:
+        self.__serve(send_body=False)
+
+    def do_GET(self) -> None:
+        self.__serve(send_body=True)
+
+    def __serve(self, send_body: bool) -> None:
+        file_path = unquote(self.path.split('?')[0]).lstrip('/')
+        root = os.path.realpath(get_resource_path())
+        path = os.path.realpath(os.path.join(root, file_path))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            self.send_error(404)
+            return
+
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        range_header = self.headers.get('Range')
+        if range_header is not None:
+            match = self.RANGE_PATTERN.match(range_header.strip())
+            if match is None or match.group(1) == match.group(2) == '':
+                self.send_error(416)
+                return
+            if match.group(1) == '': # the last n bytes
+                start = max(0, size - int(match.group(2)))
+            else:
+                start = int(match.group(1))
+                if match.group(2) != '':
+                    end = min(end, int(match.group(2)))
+            if start >= size or start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.end_headers()
+                return
+
+        self.send_response(206 if range_header is not None else 200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        if range_header is not None:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        if not send_body:
+            return
+
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(FileServer.CHUNK_SIZE, remaining))
+                if len(chunk) == 0:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    def log_message(self, format: str, *args) -> None:
+        pass # the backend prints enough already
+
+file_server = FileServer()
@@ -0,0 +1,225 @@
+import os
+import time
+import threading
+import traceback
+from collections import deque
+from typing import TYPE_CHECKING, Callable, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from .database import db
+from .database_base import UserRecord
+from .database_entity import DatabaseEntity
+from .message import Message, ServerMessage
+
+if TYPE_CHECKING:
+    from Player import HumanPlayer
+
+class JobCancelled(Exception):
+    """ Raised by Job.check() in a job that was cancelled or that timed out. """
+    pass
+
+class Job:
+    """ A long-running task of a player (e.g., pulling their repository), run by the job queue. The function
+        of the job should call check() between its steps, so that it stops when it is cancelled or times
+        out, and may call report_progress() to keep the player informed.
+    """
+
+    def __init__(self, job_id: int, kind: str, player: "HumanPlayer", run: Callable[["Job"], list[Message]], timeout: float) -> None:
+        self.job_id: int = job_id
+        self.kind: str = kind
+        self.player: "HumanPlayer" = player
+        self.status: str = 'queued' # then running, and finally done, failed, cancelled or timed out
+        self.submitted: float = time.time()
+        self.started: Optional[float] = None
+        self._run = run
+        self._timeout: float = timeout
+        self._queue: Optional["JobQueue"] = None
+
+    def get_owner(self) -> str:
+        return self.player.get_name()
+
+    def is_finished(self) -> bool:
+        return self.status not in ('queued', 'running')
+
+    def is_overdue(self) -> bool:
+        return self.started is not None and time.time() - self.started > self._timeout
+
+    def get_remaining_time(self) -> float:
+        """ Returns the seconds left before the job times out (e.g., to bound the subprocesses it runs). """
+        elapsed = time.time() - self.started if self.started is not None else 0
+        return max(0.0, self._timeout - elapsed)
+
+    def check(self) -> None:
+        """ Raise JobCancelled if the job should stop (cancelled or timed out). """
+        if self.status in ('cancelled', 'timed out') or self.is_overdue():
+            raise JobCancelled()
+
+    def report_progress(self, text: str) -> None:
+        """ Send a progress message to the player. """
+        self.check()
+        if self._queue is not None:
+            self._queue.send_messages([ServerMessage(self.player, f"[{self.kind} #{self.job_id}] {text}")])
+
+    def __str__(self) -> str:
+        return f"{self.kind} #{self.job_id} ({self.status})"
+
+class JobQueue(DatabaseEntity):
+    """ Runs the long-running jobs of the players in first-in, first-out order, with at most MAX_RUNNING
+        jobs at once overall and MAX_RUNNING_PER_USER per player; the other jobs wait in the queue. The
+        jobs that are queued or running are recorded in the database, so that the jobs interrupted by a
+        crash can be cleared (and their owners told) when the server restarts (see recover()).
+
+        A running job that is cancelled or times out is only marked as such: it keeps its place among the
+        running jobs until its function returns (see Job.check), so that the limits hold and its owner
+        cannot start the same kind of job over it (e.g., two pulls into the same checkout).
+    """
+    MAX_RUNNING = os.cpu_count() or 4
+    MAX_RUNNING_PER_USER = 1
+    MAX_QUEUED_PER_USER = 3
+    DEFAULT_TIMEOUT = 5 * 60 # seconds
+
+    def __init__(self) -> None:
+        self.__lock = threading.RLock()
+        self.__queued: deque[Job] = deque()
+        self.__running: dict[int, Job] = {}
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__message_handler: Optional[Callable[[list[Message]], None]] = None
+
+    def get_name(self) -> str:
+        return 'jobs'
+
+    def set_message_handler(self, message_handler: Optional[Callable[[list[Message]], None]]) -> None:
+        """ Set the function that receives the messages of the jobs (progress and results). """
+        self.__message_handler = message_handler
+
+    def send_messages(self, messages: list[Message]) -> None:
+        message_handler = self.__message_handler
+        if message_handler is not None:
+            message_handler(messages)
+
+    def recover(self) -> None:
+        """ Clear the jobs that were queued or running when the server stopped, and leave a notice to their owners. """
+        interrupted = self.get_state('active_jobs', {})
+        for job in interrupted.values():
+            notice = f"Your {job['kind']} job #{job['id']} was interrupted by a server restart. Please try again."
+            db.modify_value(UserRecord(job['owner']), 'notices', lambda notices: notices + [notice], [])
+        if len(interrupted) > 0:
+            self.set_state('active_jobs', {})
+
+    def submit(self, player: "HumanPlayer", kind: str, run: Callable[[Job], list[Message]], timeout: Optional[float] = None) -> tuple[Optional[Job], list[Message]]:
+        """ Queue a job for the player. Returns the job (None if it was refused) and the messages acknowledging
+            it, with its position in the queue.
+
+        Arguments:
+            player: the owner of the job
+            kind: what the job does, e.g. pull
+            run: the function of the job, which returns the messages to send when it is done
+            timeout: seconds after which a running job is stopped (None for the default)
+        """
+        with self.__lock:
+            owned = [job for job in list(self.__queued) + list(self.__running.values()) if job.get_owner() == player.get_name()]
+            if len([job for job in owned if job.status == 'queued']) >= self.MAX_QUEUED_PER_USER:
+                return None, [ServerMessage(player, f"You already have {self.MAX_QUEUED_PER_USER} jobs waiting. Use /jobs to see them, or /cancel to cancel one.")]
+            for job in owned:
+                if job.kind == kind and job.is_finished(): # cancelled or timed out, but still running
+                    return None, [ServerMessage(player, f"Your {job.kind} job #{job.job_id} is still stopping. Please try again in a moment.")]
+                if job.kind == kind:
+                    return None, [ServerMessage(player, f"Your {job} is not finished yet. Use /cancel {job.job_id} to cancel it.")]
+
+            job = Job(self.increment('next_job_id'), kind, player, run, timeout if timeout is not None else self.DEFAULT_TIMEOUT)
+            job._queue = self
+            self.__queued.append(job)
+            self.__record(job)
+            position = len(self.__queued)
+            self.__schedule()
+
+        if job.status == 'running':
+            return job, [ServerMessage(player, f"Your {kind} job #{job.job_id} has started. You will be notified when it completes.")]
+        return job, [ServerMessage(player, f"Your {kind} job #{job.job_id} is number {position} in the queue. You will be notified when it starts.")]
+
+    def get_jobs(self, player: "HumanPlayer") -> list[tuple[Job, int]]:
+        """ Returns the unfinished jobs of the player, with their position in the queue (0 if running). """
+        with self.__lock:
+            jobs = [(job, 0) for job in self.__running.values() if job.get_owner() == player.get_name() and not job.is_finished()]
+            jobs += [(job, position + 1) for position, job in enumerate(self.__queued) if job.get_owner() == player.get_name()]
+        return jobs
+
+    def cancel(self, player: "HumanPlayer", job_id: Optional[int] = None) -> list[Message]:
+        """ Cancel the given job of the player, or their most recent one. """
+        with self.__lock:
+            jobs = [job for job, _ in self.get_jobs(player) if job_id is None or job.job_id == job_id]
+            if len(jobs) == 0:
+                return [ServerMessage(player, "You have no such job.")]
+            job = max(jobs, key=lambda job: job.job_id)
+            self.__finish(job, 'cancelled')
+        return [ServerMessage(player, f"Your {job.kind} job #{job.job_id} has been cancelled.")]
+
+    def update(self) -> list[Message]:
+        """ Stop the running jobs that have timed out (called periodically). """
+        messages: list[Message] = []
+        with self.__lock:
+            for job in list(self.__running.values()):
+                if job.is_overdue():
+                    self.__finish(job, 'timed out')
+                    messages.append(self.__get_timeout_message(job))
+        return messages
+
+    def __get_timeout_message(self, job: Job) -> Message:
+        return ServerMessage(job.player, f"Your {job.kind} job #{job.job_id} took too long and was stopped.")
+
+    def __record(self, job: Job) -> None:
+        record = {'id': job.job_id, 'kind': job.kind, 'owner': job.get_owner(), 'status': job.status, 'submitted': job.submitted}
+        self.modify_state('active_jobs', lambda jobs: {**jobs, str(job.job_id): record}, {})
+
+    def __finish(self, job: Job, status: str) -> None:
+        # a queued job is removed at once, while a running job stays until its function returns (see __run);
+        # must be called with the lock held
+        if job.is_finished():
+            return
+        job.status = status
+        if job in self.__queued:
+            self.__queued.remove(job)
+            self.__remove(job)
+
+    def __remove(self, job: Job) -> None:
+        # must be called with the lock held
+        self.__running.pop(job.job_id, None)
+        self.modify_state('active_jobs', lambda jobs: {key: value for key, value in jobs.items() if key != str(job.job_id)}, {})
+        self.__schedule()
+
+    def __schedule(self) -> None:
+        # start the first queued jobs that fit within the limits; must be called with the lock held
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(max_workers=self.MAX_RUNNING, thread_name_prefix='job')
+        for job in list(self.__queued):
+            if len(self.__running) >= self.MAX_RUNNING:
+                break
+            if len([other for other in self.__running.values() if other.get_owner() == job.get_owner()]) >= self.MAX_RUNNING_PER_USER:
+                continue
+            self.__queued.remove(job)
+            job.status = 'running'
+            job.started = time.time()
+            self.__running[job.job_id] = job
+            self.__record(job)
+            self.__executor.submit(self.__run, job)
+
+    def __run(self, job: Job) -> None:
+        try:
+            messages = job._run(job)
+            status = 'done'
+        except JobCancelled:
+            # unless it was cancelled (then already finished), the job stopped itself because it timed out
+            messages, status = [self.__get_timeout_message(job)], 'timed out'
+        except:
+            messages = [ServerMessage(job.player, f"Your {job.kind} job #{job.job_id} failed: {traceback.format_exc()}")]
+            status = 'failed'
+
+        with self.__lock:
+            finished = job.is_finished() # cancelled or timed out in the meantime; its results are dropped
+            if not finished:
+                job.status = status
+            self.__remove(job)
+        if not finished:
+            self.send_messages(messages)
+
+job_queue = JobQueue()
@@ -1,9 +1,12 @@
+from typing import Optional
 
 from ..coord import *
 from ..NPC import NPC
 from ..message import *
 from ..maps.commands import *
-from ..command import ChatCommand
+from ..command import ChatCommand, CommandIndex
+from ..command_runner import command_runner
+from ..profiler import profiler
 from ..Player import Player, HumanPlayer
 from ..database_entity import DatabaseEntity
 from ..tiles.base import Tile, MapObject, Exit
@@ -44,17 +47,29 @@ class Map(RecipientInterface, DatabaseEntity):
         self.__exits: list[Exit] = []
         self.__setup_tilemap(background_tile_image)
 
-        self.__commands: list[type[ChatCommand]] = [ListCommand, EmailTestCommand, GetStateCommand, SetStateCommand, DeleteStateCommand, MessageCommand, GetProposalsCommand, GetTAReviewCommand] + chat_commands
+        command_classes: list[type[ChatCommand]] = [ListCommand, EmailTestCommand, GetStateCommand, SetStateCommand, DeleteStateCommand, AuditLogCommand, MessageCommand, JobsCommand, CancelCommand, GetProposalsCommand, GetTAReviewCommand] + chat_commands
+        self.__commands = CommandIndex([command_cls() for command_cls in command_classes])
 
         RecipientInterface.__init__(self)
     
+    def __setstate__(self, state: dict) -> None:
+        """ A map built in another process gets a new ID once it is unpickled here. """
+        self.__dict__.update(state)
+        self.__room_id = Map.NEXT_ID
+        Map.NEXT_ID += 1
+
     def get_objects(self) -> list[tuple[MapObject, Coord]]:
         """ Get the objects that are placed on the map. Must be implemented by subclasses. """
         raise NotImplementedError
 
     def __setup_tilemap(self, background_tile_image: str):
-        objects = self.get_objects()
+        with profiler.span(type(self).__name__, 'get_objects'):
+            objects = self.get_objects()
 
+        with profiler.span(type(self).__name__, 'tilemap'):
+            self.__fill_tilemap(objects, background_tile_image)
+
+    def __fill_tilemap(self, objects: list[tuple[MapObject, Coord]], background_tile_image: str):
         # background
         if len(background_tile_image) > 0:
             bg = MapObject.get_obj(background_tile_image)
@@ -76,6 +91,10 @@ class Map(RecipientInterface, DatabaseEntity):
         for map_object in self.__objects:
             self.__exits.extend(map_object.get_exits())
 
+    def get_map_objects(self) -> list[MapObject]:
+        """ Returns the objects currently placed on the map (including NPCs and players). """
+        return list(self.__objects)
+
     def get_exits(self) -> list[Exit]:
         """ Returns a list of exits from the map. """
         return list(self.__exits)
@@ -117,27 +136,28 @@ class Map(RecipientInterface, DatabaseEntity):
     def list_commands(self, player: "HumanPlayer") -> str:
         """ Returns a list of commands available in the map. """
         cmds: str = ''
-        for command in self.__commands:
+        for command in self.__commands.get_commands():
             if command.visibility == 'admin' and player.get_name() not in ["jcampbell", "admin"]:
                 continue
             cmds += f"{command.name}: {command.desc}\n"
         return cmds[:-1]
 
+    def find_command(self, command_s: str) -> Optional[ChatCommand]:
+        """ Returns the command of the map that matches the command string, or None if there is none. """
+        return self.__commands.find(command_s.lower())
+
     def execute_command(self, player: "HumanPlayer", command_s: str) -> list[Message]:
         """ Execute a command for the player, taking the command string as input, and finding the
-            appropriate command class to instantiate.
+            appropriate command in the map's command index.
         """
-        
-        command_s_lower = command_s.lower()
-        for command_cls in self.__commands:
-            if command_cls.matches(command_s_lower):
-                # Instantiate the command
-                command_obj: ChatCommand = command_cls()
-                break
-        else:
+        return self.run_command(player, self.find_command(command_s), command_s)
+
+    def run_command(self, player: "HumanPlayer", command_obj: Optional[ChatCommand], command_s: str) -> list[Message]:
+        """ Execute a command of the map (as found by find_command, None if there was none) for the player. """
+        if command_obj is None:
             return [ServerMessage(player, f"Invalid command. The following commands are available:\n{self.list_commands(player)}")]
-        
-        return command_obj.execute(command_s, self, player)
+
+        return command_runner.run(command_obj, command_s, self, player)
 
     def __str__(self) -> str:
         """ Returns a string representation of the map. """
@@ -276,6 +296,42 @@ class Map(RecipientInterface, DatabaseEntity):
                 self.remove_from_grid(player_, player_.get_current_position())
                 break
 
+    def get_runtime_state(self) -> dict:
+        """ Returns the state of the map that only lives in memory (i.e., that is not saved through
+            get_state/set_state), so that the map can be rebuilt later with set_runtime_state.
+            Maps that change at runtime should extend this (and set_runtime_state) with their own state.
+        """
+        objects = {}
+        for obj in self.__objects:
+            obj_state = obj.get_runtime_state()
+            if obj_state is not None:
+                objects[self.__get_object_key(obj)] = obj_state
+        return {
+            'npcs': [(npc.get_current_position().to_tuple(), npc.get_facing_direction()) for npc in self.__npcs],
+            'objects': objects,
+        }
+
+    def set_runtime_state(self, state: dict) -> None:
+        """ Restore the runtime state of a newly built map, as returned by get_runtime_state. """
+        for npc, (position, facing_direction) in zip(self.__npcs, state.get('npcs', [])):
+            npc.set_facing_direction(facing_direction)
+            if npc.get_current_position().to_tuple() != tuple(position):
+                self.remove_from_grid(npc, npc.get_current_position())
+                self.add_to_grid(npc, Coord(*position))
+                npc.update_position(Coord(*position), self)
+
+        object_states = state.get('objects', {})
+        if len(object_states) > 0:
+            for obj in list(self.__objects):
+                key = self.__get_object_key(obj)
+                if key in object_states:
+                    obj.set_runtime_state(object_states[key])
+
+    @staticmethod
+    def __get_object_key(obj: MapObject) -> str:
+        # objects with a runtime state are identified by their class and (initial) position on the map
+        return f'{type(obj).__name__}@{obj.get_position().y},{obj.get_position().x}'
+
     def update(self) -> list[Message]:
         """ Called every second; anything that happens in the room autonomously (i.e., without needing
             player input) should be implemented here. A list of messages should be returned.
@@ -1,8 +1,12 @@
 import os
-import csv
+from datetime import datetime
 from typing import TYPE_CHECKING
 
 from ..database import db
+from ..audit_log import audit_log
+from ..user_directory import user_directory
+from ..jobs import job_queue
+from ..csv_tables import csv_tables
 from ..command import ChatCommand
 from ..resources import get_resource_path
 from ..message import FileMessage, Message, ServerMessage
@@ -45,24 +49,23 @@ class GetStateCommand(ChatCommand):
     name = 'get_state'
     desc = 'Get a state for a player.'
     visibility = 'admin'
+    arg_separator = '#'
 
     @classmethod
     def matches(cls, command_text: str) -> bool:
         return command_text.startswith('get_state')
     
     def execute(self, command_text: str, context: "Map", player: "HumanPlayer") -> list[Message]:
-        _, handle, k = command_text.split("#")
-        db_users = db.get_all_users()
-        for user in db_users:
-            if user.name == handle:
-                state = db.get_state(user, "Users")
-                if k not in state:
-                    msg = f'State: {handle}: {k} not found. Full state: {state}.'
-                else:
-                    msg = f'State: {handle}: {k}->{state[k]}.'
-                break
+        handle, k = self.parse_args(command_text)
+        user = user_directory.get_user(handle)
+        if user is not None:
+            state = db.get_state(user, "Users")
+            if k not in state:
+                msg = f'State: {handle}: {k} not found. Full state: {state}.'
+            else:
+                msg = f'State: {handle}: {k}->{state[k]}.'
         else:
-            msg = f"{handle} not found; available user handles: {', '.join([user.name for user in db_users])}"
+            msg = f"{handle} not found; available user handles: {', '.join(user_directory.get_handles())}"
         return [ServerMessage(player, msg)]
 
 class SetStateCommand(ChatCommand):
@@ -71,27 +74,24 @@ class SetStateCommand(ChatCommand):
     name = 'set_state'
     desc = 'Set a state for a player.'
     visibility = 'admin'
+    arg_separator = '#'
 
     @classmethod
     def matches(cls, command_text: str) -> bool:
         return command_text.startswith('set_state')
     
     def execute(self, command_text: str, context: "Map", player: "HumanPlayer") -> list[Message]:
-        _, handle, k, v = command_text.split("#")
+        handle, k, v = self.parse_args(command_text)
         if v.lower() in ["true", "false"]:
             v = bool(v.capitalize())
         elif v.isdecimal():
             v = int(v)
 
-        db_users = db.get_all_users()
-        for user in db_users:
-            if user.name == handle:
-                state = db.get_state(user, "Users")
-                print(f"Existing state for {user.name}:", state)
-                state[k] = v
-                db.update_state(user, state, "Users")
-                msg = f'State updated: {handle}: {k}->{v}.'
-                break
+        user = user_directory.get_user(handle)
+        if user is not None:
+            print(f"Existing state for {user.name}:", db.get_state(user, "Users"))
+            db.update_keys(user, {k: v})
+            msg = f'State updated: {handle}: {k}->{v}.'
         else:
             msg = f"{handle} not found"
         return [ServerMessage(player, msg)]
@@ -102,25 +102,52 @@ class DeleteStateCommand(ChatCommand):
     name = 'delete_state'
     desc = 'Delete a state for a player.'
     visibility = 'admin'
+    arg_separator = '#'
 
     @classmethod
     def matches(cls, command_text: str) -> bool:
         return command_text.startswith('delete_state')
     
     def execute(self, command_text: str, context: "Map", player: "HumanPlayer") -> list[Message]:
-        _, handle, k = command_text.split("#")
-        db_users = db.get_all_users()
-        for user in db_users:
-            if user.name == handle:
-                state = db.get_state(user, "Users")
-                del state[k]
-                db.update_state(user, state, "Users")
-                msg = 'updated'
-                break
+        handle, k = self.parse_args(command_text)
+        user = user_directory.get_user(handle)
+        if user is not None:
+            db.update_keys(user, {}, [k])
+            msg = 'updated'
         else:
             msg = f"{handle} not found"
         return [ServerMessage(player, msg)]
 
+class AuditLogCommand(ChatCommand):
+    """ Command to show the latest audit log records, of a user or of an event. Admin-only command. """
+
+    name = 'audit_log'
+    desc = 'Show the audit log: /audit_log, /audit_log#user#<email> or /audit_log#event#<event>.'
+    visibility = 'admin'
+    arg_separator = '#'
+    blocking = True # waits for the pending records to be written
+    LIMIT = 20
+
+    @classmethod
+    def matches(cls, command_text: str) -> bool:
+        return command_text.startswith('audit_log')
+
+    def execute(self, command_text: str, context: "Map", player: "HumanPlayer") -> list[Message]:
+        args = self.parse_args(command_text, maxsplit=1)
+        if len(args) == 0:
+            records = audit_log.query(limit=self.LIMIT)
+        elif len(args) == 2 and args[0] == 'user':
+            records = audit_log.query(user=args[1], limit=self.LIMIT)
+        elif len(args) == 2 and args[0] == 'event':
+            records = audit_log.query(event=args[1], limit=self.LIMIT)
+        else:
+            return [ServerMessage(player, "Invalid command. Please use the format /audit_log, /audit_log#user#<email> or /audit_log#event#<event>")]
+
+        if len(records) == 0:
+            return [ServerMessage(player, "No audit records found.")]
+        lines = [f"{datetime.fromtimestamp(record.time).isoformat(timespec='seconds')} [{record.event}] {record.user}: {record.message}" for record in records]
+        return [ServerMessage(player, "Audit log (newest first):\n" + "\n".join(lines))]
+
 class MessageCommand(ChatCommand):
     """ Command to send a message to another player. """
 
@@ -132,48 +159,81 @@ class MessageCommand(ChatCommand):
         return command_text.startswith('message')
     
     def execute(self, command_text: str, context: "Map", player: "HumanPlayer") -> list[Message]:
-        command = command_text[len("message ")-1:]
-        space = command.find(" ")
-        handle = command[:space]
-        message = command[space+1:]
-
-        for client in context.get_human_players():
-            if client.get_name().lower() == handle.lower():
-                break
-        else:
-            return [ServerMessage(player, f"Couldn't find {handle} in the current room.")]
+        args = self.parse_args(command_text, maxsplit=1)
+        if len(args) != 2:
+            return [ServerMessage(player, "Invalid command. Please use the format /message <handle> <message>")]
+        handle, message = args
+
+        user = user_directory.get_user(handle)
+        client = user.player if user is not None else None
+        if client is None:
+            return [ServerMessage(player, f"Couldn't find {handle} online.")]
 
         return [
             ServerMessage(client, f"{player.get_name()} sends you a message: {message}"),
             ServerMessage(player, f"Message sent to {handle}."),
         ]
 
+class JobsCommand(ChatCommand):
+    """ Command to list the jobs of the player that are running or waiting in the queue. """
+
+    name = 'jobs'
+    desc = 'List your running and queued jobs.'
+
+    @classmethod
+    def matches(cls, command_text: str) -> bool:
+        return command_text == 'jobs'
+
+    def execute(self, command_text: str, context: "Map", player: "HumanPlayer") -> list[Message]:
+        jobs = job_queue.get_jobs(player)
+        if len(jobs) == 0:
+            return [ServerMessage(player, "You have no running or queued jobs.")]
+        lines = []
+        for job, position in jobs:
+            if position == 0:
+                lines.append(f"#{job.job_id} {job.kind}: running")
+            else:
+                lines.append(f"#{job.job_id} {job.kind}: number {position} in the queue")
+        return [ServerMessage(player, "Your jobs:\n" + "\n".join(lines))]
+
+class CancelCommand(ChatCommand):
+    """ Command to cancel a job of the player (their most recent one by default). """
+
+    name = 'cancel'
+    desc = 'Cancel one of your jobs: /cancel [job number]'
+
+    @classmethod
+    def matches(cls, command_text: str) -> bool:
+        return command_text.startswith('cancel')
+
+    def execute(self, command_text: str, context: "Map", player: "HumanPlayer") -> list[Message]:
+        args = self.parse_args(command_text)
+        if len(args) > 1 or (len(args) == 1 and not args[0].lstrip('#').isdigit()):
+            return [ServerMessage(player, "Invalid command. Please use the format /cancel [job number]")]
+        job_id = int(args[0].lstrip('#')) if len(args) == 1 else None
+        return job_queue.cancel(player, job_id)
+
 class GetProposalsCommand(ChatCommand):
     name = 'get_proposals'
     desc = 'Get proposals for a student to review.'
+    aliases = ('get_propo',)
 
     @classmethod
     def matches(cls, command_text: str) -> bool:
         return command_text.startswith('get_propo')
     
     def execute(self, command_text: str, context: "Map", player: "HumanPlayer") -> list[Message]:
-        # load the review_assignments.csv file as a dict
-        assignments = {}
-        with open("review_assignments.csv") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                assignments[row["Student"]] = row
-        
         # get the row for the student.
         email = player.get_email()
-        if email not in assignments:
+        assignment = csv_tables.get_table("review_assignments.csv").find_one("Student", email)
+        if assignment is None:
             return [ServerMessage(player, f"No proposals found for {email}.")]
         
-        archive_filename = assignments[email]["Filenames"]
+        archive_filename = assignment["Filenames"]
         if not os.path.exists(get_resource_path(f"proposals/{archive_filename}.zip")):
             return [ServerMessage(player, f"Archive file {archive_filename} not found.")]
 
-        db.log("get_proposals", f"{player.get_name()} downloaded {archive_filename}.zip")
+        db.log("get_proposals", f"{player.get_name()} downloaded {archive_filename}.zip", user=player.get_email())
 
         return [
             ServerMessage(player, f"Downloading file."),
@@ -189,27 +249,19 @@ class GetTAReviewCommand(ChatCommand):
         return command_text.lower().startswith('get_review')
     
     def execute(self, command_text: str, context: "Map", player: "HumanPlayer") -> list[Message]:
-        # get student's group
-        with open("groups.csv") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row["Email"] == player.get_email():
-                    group = row["Group"]
-                    break
-            else:
-                return [ServerMessage(player, f"Group not found for {player.get_email()}")]
+        # get student's group (the first matching row)
+        group_rows = csv_tables.get_table("groups.csv").find("Email", player.get_email())
+        if len(group_rows) == 0:
+            return [ServerMessage(player, f"Group not found for {player.get_email()}")]
+        group = group_rows[0]["Group"]
         
-        # get the PDF filename for the student's group
-        with open("proposal_zip_by_group.csv") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row["group"] == group:
-                    archive_filename = row["filename"]
-                    break
-            else:
-                return [ServerMessage(player, f"file for group {group} not found.")]
+        # get the PDF filename for the student's group (the first matching row)
+        archive_rows = csv_tables.get_table("proposal_zip_by_group.csv").find("group", group)
+        if len(archive_rows) == 0:
+            return [ServerMessage(player, f"file for group {group} not found.")]
+        archive_filename = archive_rows[0]["filename"]
 
-        db.log("get_review", f"{player.get_name()} downloaded {archive_filename}.zip")
+        db.log("get_review", f"{player.get_name()} downloaded {archive_filename}.zip", user=player.get_email())
 
         return [
             ServerMessage(player, f"Downloading file."),
@@ -91,6 +91,7 @@ class NewGameCommand(ChatCommand):
 class PlaceMarkXCommand(ChatCommand):
     name = 'x'
     desc = 'Place an x (X#,#).'
+    arg_separator = ','
 
     @classmethod
     def matches(cls, command_text: str) -> bool:
@@ -98,8 +99,8 @@ class PlaceMarkXCommand(ChatCommand):
     
     def execute(self, command_text: str, context: "TicTacToeHouse", player: HumanPlayer) -> list[Message]:
         messages = []
-        # Parse the position from the command (e.g., "X3:5")
-        pos = int(command_text[1]), int(command_text[3])
+        # Parse the position from the command (e.g., "X3,5")
+        pos = tuple(int(arg) for arg in self.parse_args(command_text))
         pos = (pos[0] + 15, pos[1] + 15)
         context.game_board.place_mark(pos[0], pos[1], Mark.X)
         context.add_to_grid(MapObject.get_obj('flower_large_red'), Coord(pos[0], pos[1]))
@@ -111,6 +112,7 @@ class PlaceMarkXCommand(ChatCommand):
 class PlaceMarkOCommand(ChatCommand):
     name = 'o'
     desc = 'Place an O (O#,#).'
+    arg_separator = ','
 
     @classmethod
     def matches(cls, command_text: str) -> bool:
@@ -118,7 +120,7 @@ class PlaceMarkOCommand(ChatCommand):
     
     def execute(self, command_text: str, context: "TicTacToeHouse", player: HumanPlayer) -> list[Message]:
         messages = []
-        pos = int(command_text[1]), int(command_text[3])
+        pos = tuple(int(arg) for arg in self.parse_args(command_text))
         pos = (pos[0] + 15, pos[1] + 15)
         context.game_board.place_mark(pos[0], pos[1], Mark.O)
         context.add_to_grid(MapObject.get_obj('rock_1'), Coord(pos[0], pos[1]))
@@ -143,6 +145,23 @@ class TicTacToeHouse(Map):
         self.clear_board
         self.game_board = TicTacToeBoard()
 
+    def get_runtime_state(self) -> dict:
+        state = super().get_runtime_state()
+        if hasattr(self, 'game_board'):
+            state['game_board'] = [[mark.value for mark in row] for row in self.game_board.grid]
+        state['placed_objects'] = [(obj.get_shared_name(), coord.to_tuple()) for obj, coord in self.placed_objects]
+        return state
+
+    def set_runtime_state(self, state: dict) -> None:
+        super().set_runtime_state(state)
+        if 'game_board' in state:
+            self.game_board = TicTacToeBoard()
+            self.game_board.grid = [[Mark(value) for value in row] for row in state['game_board']]
+        for obj_name, position in state.get('placed_objects', []):
+            obj = MapObject.get_obj(obj_name)
+            self.add_to_grid(obj, Coord(*position))
+            self.placed_objects.append((obj, Coord(*position)))
+
     def get_objects(self) -> list[tuple[MapObject, Coord]]:
         objects: list[tuple[MapObject, Coord]] = []
 
@@ -1,16 +1,12 @@
-import os
 import csv
 import random
-
-import yt_dlp
-
-# TODO: Replace with gevent compatible library.
-#from youtubesearchpython import VideosSearch
+from typing import Optional
 
 from ...coord import Coord
 from ...maps.base import Map
 from ...tiles.map_objects import *
 from ...resources import get_resource_path
+from ...media_cache import media_cache
 from ...tiles.base import MapObject, Subject
 
 class RandomMusicPlayingPressurePlate(MusicPlayingPressurePlate, Subject):
@@ -18,41 +14,40 @@ class RandomMusicPlayingPressurePlate(MusicPlayingPressurePlate, Subject):
         self.__songs = songs
         self.__artist_name = artist_name
         self.__chosen_song_name = ""
+        self.__song_fname = ""
+        self.__choices: tuple[list[str], list[str]] = ([], []) # the texts of the boards and of the pressure plates
         MusicPlayingPressurePlate.__init__(self)
         Subject.__init__(self)  # initialize the observer list
+        self.__prefetch_songs() # so that they are ready by the time a player steps on the plate
+
+    def __setstate__(self, state: dict) -> None:
+        """ A plate built in another process prefetches the songs once it is unpickled here. """
+        self.__dict__.update(state)
+        self.__prefetch_songs()
+
+    def __get_song_fnames(self) -> list[str]:
+        return [f'tswift/{index}' for index in range(len(self.__songs))]
+
+    def __prefetch_songs(self) -> None:
+        song_fnames = self.__get_song_fnames()
+        media_cache.prefetch({song_fname: f'{row[0]} {self.__artist_name}' for song_fname, row in zip(song_fnames, self.__songs)})
 
     def get_chosen_song_name(self):
         return self.__chosen_song_name
 
     def player_entered(self, player) -> list[Message]:
-        chosen_song_index = random.randint(0, len(self.__songs)-1)
-        chosen_song_name = self.__songs[chosen_song_index][0]
+        # only pick among the songs that are ready (fetching again the ones that failed)
+        self.__prefetch_songs()
+        song_fnames = self.__get_song_fnames()
+        cached_song_fnames = media_cache.get_cached(song_fnames)
+        if len(cached_song_fnames) == 0:
+            return [DialogueMessage(self, player, "The songs are still loading. Please try again in a moment!", "sign")]
+
+        song_fname = random.choice(cached_song_fnames)
+        chosen_song_name = self.__songs[song_fnames.index(song_fname)][0]
         self.__chosen_song_name = chosen_song_name
 
-        song_fname = f'tswift/{chosen_song_index}'
-        song_path = get_resource_path(f'sound/{song_fname}')
-
-        if not os.path.exists(get_resource_path('sound/tswift')):
-            os.makedirs(get_resource_path('sound/tswift'))
-
-        if not os.path.exists(song_path + ".mp3"):
-            videosSearch = VideosSearch(chosen_song_name + " " + self.__artist_name, limit=10)
-            result = videosSearch.result()
-            url = result['result'][0]['link'] # type: ignore
-
-            ydl_opts = {
-                'download_ranges': yt_dlp.download_range_func(None, [(13, 14)]),
-                'outtmpl': song_path,
-                'final_ext': 'mp3',
-                'format': 'bestaudio',
-                'postprocessors': [{'key': 'FFmpegExtractAudio',
-                                    'nopostoverwrites': False,
-                                    'preferredcodec': 'mp3',
-                                    'preferredquality': '0'}]
-            }
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download(url)
-
+        self.__song_fname = song_fname
         self.set_sound_path(song_fname)
 
         # Notify observers (the boards) that the chosen song has changed
@@ -62,11 +57,31 @@ class RandomMusicPlayingPressurePlate(MusicPlayingPressurePlate, Subject):
         random.shuffle(names_and_texts)
         song_names, pplate_texts = zip(*names_and_texts)
 
+        self.__choices = (list(song_names), list(pplate_texts))
         self.notify_each_by_type(song_names, Board)
         self.notify_each_by_type(pplate_texts, PressurePlate)
 
         return super().player_entered(player) + [DialogueMessage(self, player, f"Can you guess the song??", "sign")]
 
+    def get_runtime_state(self) -> Optional[dict]:
+        if len(self.__chosen_song_name) == 0:
+            return None
+        song_names, pplate_texts = self.__choices
+        return {
+            'chosen_song_name': self.__chosen_song_name,
+            'song_fname': self.__song_fname,
+            'song_names': song_names,
+            'pplate_texts': pplate_texts,
+        }
+
+    def set_runtime_state(self, state: dict) -> None:
+        self.__chosen_song_name = state['chosen_song_name']
+        self.__song_fname = state['song_fname']
+        self.__choices = (state['song_names'], state['pplate_texts'])
+        self.set_sound_path(self.__song_fname)
+        self.notify_each_by_type(state['song_names'], Board)
+        self.notify_each_by_type(state['pplate_texts'], PressurePlate)
+
 class TriviaHouse(Map):
     def __init__(self):
         with open(get_resource_path('tswift_songs.csv'), newline='') as csvfile:
@@ -11,11 +11,8 @@ from ..maps.map_helper import is_large_tree_area
 
 class TellJokeCommand(MenuCommand):
     def execute(self, context: "Map", player: "HumanPlayer") -> list[Message]:
-        num_jokes_told_to_player = player.get_state('num_jokes_received', 0)
-        player.set_state('num_jokes_received', num_jokes_told_to_player+1)
-        
-        num_jokes_told = context.get_state('num_jokes_told', 0)
-        context.set_state('num_jokes_told', num_jokes_told+1)
+        player.increment('num_jokes_received')
+        context.increment('num_jokes_told')
         
         return [ServerMessage(player, "Why did the scarecrow win an award? Because he was outstanding in his field!")]
 
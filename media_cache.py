@@ -0,0 +1,119 @@
+import os
+import shutil
+import threading
+import traceback
+import multiprocessing
+from abc import ABC, abstractmethod
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from .resources import get_resource_path
+from .util import lazy_import
+
+yt_dlp = lazy_import('yt_dlp')
+
+class MediaFetcher(ABC):
+    """ Fetches the audio for a search query (e.g., a song title and artist) into an mp3 file. """
+
+    @abstractmethod
+    def fetch(self, query: str, path: str) -> None:
+        """ Fetch the audio for the query into path + '.mp3'. Raises an exception if it cannot be found. """
+        pass
+
+class YoutubeFetcher(MediaFetcher):
+    """ Downloads a second of the first YouTube result for the query, transcoded to mp3 (needs ffmpeg). """
+
+    def fetch(self, query: str, path: str) -> None:
+        ydl_opts = {
+            'download_ranges': yt_dlp.download_range_func(None, [(13, 14)]),
+            'outtmpl': path,
+            'final_ext': 'mp3',
+            'format': 'bestaudio',
+            'quiet': True,
+            'postprocessors': [{'key': 'FFmpegExtractAudio',
+                                'nopostoverwrites': False,
+                                'preferredcodec': 'mp3',
+                                'preferredquality': '0'}]
+        }
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            ydl.download([f'ytsearch1:{query}'])
+
+class LocalFileFetcher(MediaFetcher):
+    """ Copies <query>.mp3 from a local directory, or default.mp3 if there is no such file (e.g., for
+        running without network access).
+    """
+
+    def __init__(self, source_dir: str) -> None:
+        self.__source_dir: str = source_dir
+
+    def fetch(self, query: str, path: str) -> None:
+        source_path = os.path.join(self.__source_dir, query + '.mp3')
+        if not os.path.exists(source_path):
+            source_path = os.path.join(self.__source_dir, 'default.mp3')
+        shutil.copyfile(source_path, path + '.mp3')
+
+class MediaCache:
+    """ Fetches sounds into the resources (as sound/<name>.mp3) on a background pool of threads, so that
+        the objects that play them never wait on a download: they prefetch the sounds they may need, and
+        then only pick among the ones that are already cached (see get_cached). The fetcher is set by the
+        MEDIA_SOURCE_DIR environment variable (a directory to copy the files from), or else downloads from
+        YouTube.
+    """
+    MAX_WORKERS = 2
+
+    def __init__(self, fetcher: Optional[MediaFetcher] = None) -> None:
+        if fetcher is None:
+            source_dir = os.environ.get('MEDIA_SOURCE_DIR', '')
+            fetcher = LocalFileFetcher(source_dir) if len(source_dir) > 0 else YoutubeFetcher()
+        self.__fetcher: MediaFetcher = fetcher
+        self.__lock = threading.Lock()
+        self.__requested: set[str] = set() # the sounds that are cached or being fetched
+        self.__executor: Optional[ThreadPoolExecutor] = None
+
+    def set_fetcher(self, fetcher: MediaFetcher) -> None:
+        self.__fetcher = fetcher
+
+    def __get_path(self, sound_name: str) -> str:
+        return get_resource_path(f'sound/{sound_name}')
+
+    def is_cached(self, sound_name: str) -> bool:
+        return os.path.exists(self.__get_path(sound_name) + '.mp3')
+
+    def get_cached(self, sound_names: list[str]) -> list[str]:
+        """ Returns the given sounds that are cached. """
+        return [sound_name for sound_name in sound_names if self.is_cached(sound_name)]
+
+    def prefetch(self, queries: dict[str, str]) -> None:
+        """ Fetch the sounds that are not cached yet in the background (unless they are already being fetched).
+            Only the main process fetches: objects that are built in other processes (see World) should
+            prefetch again once they are unpickled.
+
+        Arguments:
+            queries: the search query for each sound, by sound name (e.g., 'tswift/3')
+        """
+        if multiprocessing.current_process().name != 'MainProcess':
+            return
+        with self.__lock:
+            for sound_name, query in queries.items():
+                if sound_name in self.__requested:
+                    continue
+                self.__requested.add(sound_name)
+                if self.is_cached(sound_name):
+                    continue
+                if self.__executor is None:
+                    self.__executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix='media')
+                self.__executor.submit(self.__fetch, sound_name, query)
+
+    def __fetch(self, sound_name: str, query: str) -> None:
+        path = self.__get_path(sound_name)
+        tmp_path = path + '.download'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.__fetcher.fetch(query, tmp_path)
+            os.replace(tmp_path + '.mp3', path + '.mp3') # so that a partial file is never played
+        except:
+            print(f"Could not fetch {sound_name} ({query}):\n{traceback.format_exc()}")
+            with self.__lock:
+                self.__requested.discard(sound_name) # retried on the next prefetch
+
+media_cache = MediaCache()
@@ -2,10 +2,12 @@ import os
 import time
 import json
 from abc import ABC, abstractmethod
-from typing import Literal, TYPE_CHECKING
+from typing import Literal, Optional, TYPE_CHECKING
+from urllib.parse import quote
 
 from .coord import Coord
 from .resources import get_resource_path
+from .file_server import file_server
 if TYPE_CHECKING:
     from Player import HumanPlayer
 
@@ -188,11 +190,14 @@ class MenuMessage(Message):
         }
 
 class FileMessage(Message):
-    """ A message to download a file for a recipient. """
+    """ A message to download a file for a recipient. It carries the size and hash of the file, so that the
+        client can download it in chunks, resume interrupted downloads, and skip files that it already has.
+    """
     def __init__(self, sender, recipient, file_path: str) -> None:
         """ Initializes the file message with the recipient and file path. """
         self.__file_path: str = file_path
-        if not os.path.exists(get_resource_path(file_path)):
+        self.__file_info: Optional[tuple[int, str]] = file_server.get_file_info(file_path)
+        if self.__file_info is None:
             print(f"File {file_path} does not exist.")
         Message.__init__(self, sender, recipient)
 
@@ -200,6 +205,12 @@ class FileMessage(Message):
         return "***SERVER***"
     
     def _get_data(self) -> dict:
-        return {
+        data = {
             'file_path': self.__file_path,
-        }
\ No newline at end of file
+        }
+        if self.__file_info is not None:
+            data['size'], data['sha256'] = self.__file_info
+        base_url = file_server.get_base_url()
+        if base_url is not None: # otherwise, the client downloads it from the remote host
+            data['url'] = base_url + quote(self.__file_path)
+        return data
\ No newline at end of file
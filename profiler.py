@@ -0,0 +1,83 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+
+class StartupProfiler:
+    """ Records a timeline of nested phases (spans) while the server starts up, and saves it in the
+        Chrome trace event format, which can be opened in chrome://tracing or https://ui.perfetto.dev.
+        Recording is off until enable() is called, in which case span() costs next to nothing.
+    """
+
+    def __init__(self) -> None:
+        self.__enabled: bool = False
+        self.__events: list[dict] = []
+        self.__start: float = time.perf_counter()
+        self.__depth = threading.local()
+
+    def enable(self) -> None:
+        """ Start recording spans. """
+        self.__events = []
+        self.__start = time.perf_counter()
+        self.__enabled = True
+
+    def is_enabled(self) -> bool:
+        """ Returns whether spans are being recorded. """
+        return self.__enabled
+
+    @contextmanager
+    def span(self, name: str, category: str = 'startup', **args):
+        """ Record the time spent in the with block as a span. Spans opened inside the block are nested in it.
+
+        Arguments:
+            name: the name of the span, e.g. the name of the room being built
+            category: the kind of span (used to total the time spent per category in the report)
+            args: extra information shown with the span
+        """
+        if not self.__enabled:
+            yield
+            return
+
+        depth = getattr(self.__depth, 'value', 0)
+        self.__depth.value = depth + 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.__depth.value = depth
+            self.__events.append({
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': (start - self.__start) * 1e6,
+                'dur': (end - start) * 1e6,
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'args': {'depth': depth, **args},
+            })
+
+    def get_summary(self) -> dict[str, dict[str, float]]:
+        """ Returns the total time in milliseconds spent in each span, grouped by category, most expensive first. """
+        totals: dict[str, dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        for event in self.__events:
+            totals[event['cat']][event['name']] += event['dur'] / 1000
+        return {
+            category: dict(sorted(names.items(), key=lambda item: item[1], reverse=True))
+            for category, names in totals.items()
+        }
+
+    def save(self, path: str) -> None:
+        """ Stop recording and write the timeline to the given path as Chrome trace JSON. """
+        self.__enabled = False
+        with open(path, 'w') as f:
+            json.dump({
+                'traceEvents': sorted(self.__events, key=lambda event: event['ts']),
+                'displayTimeUnit': 'ms',
+                'otherData': {'summary_ms': self.get_summary()},
+            }, f, indent=1)
+        print(f"Startup profile written to {path}")
+
+profiler = StartupProfiler()
@@ -0,0 +1,72 @@
+import math
+import time
+import threading
+
+class TokenBucket:
+    """ Allows bursts of up to capacity actions, refilled at rate actions per second. """
+
+    def __init__(self, capacity: float, rate: float) -> None:
+        self.__capacity: float = capacity
+        self.__rate: float = rate
+        self.__tokens: float = capacity
+        self.__last_refill: float = time.monotonic()
+
+    def try_take(self, cost: float = 1) -> float:
+        """ Take cost tokens if there are enough. Returns 0 if they were taken, or else the number of
+            seconds until there will be enough.
+        """
+        now = time.monotonic()
+        self.__tokens = min(self.__capacity, self.__tokens + (now - self.__last_refill) * self.__rate)
+        self.__last_refill = now
+        if self.__tokens >= cost:
+            self.__tokens -= cost
+            return 0
+        return (cost - self.__tokens) / self.__rate
+
+    def give_back(self, cost: float = 1) -> None:
+        """ Return tokens that were taken for an action that did not happen. """
+        self.__tokens = min(self.__capacity, self.__tokens + cost)
+
+class RateLimiter:
+    """ Limits how often each player can perform each class of action (see RATE_CLASSES), with one token
+        bucket per player and class, so that a client that floods the server (e.g., a modified client
+        that does not throttle its moves) only slows itself down.
+    """
+    RATE_CLASSES: dict[str, tuple[float, float]] = { # burst capacity and refill rate (actions per second)
+        'move': (20, 10), # the client sends at most one move every 0.15 seconds
+        'chat': (5, 1),
+        'command': (10, 2),
+        'job': (10, 10 / 3600), # jobs that use an external API, e.g. pulling a repository: 10 per hour
+    }
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__buckets: dict[tuple[str, str], TokenBucket] = {}
+
+    def try_acquire(self, player_name: str, rate_class: str) -> float:
+        """ Count an action of the player. Returns 0 if it is allowed, or else the number of seconds to wait
+            before it will be.
+        """
+        with self.__lock:
+            bucket = self.__buckets.get((player_name, rate_class))
+            if bucket is None:
+                capacity, rate = self.RATE_CLASSES[rate_class]
+                bucket = TokenBucket(capacity, rate)
+                self.__buckets[(player_name, rate_class)] = bucket
+            return bucket.try_take()
+
+    def refund(self, player_name: str, rate_class: str) -> None:
+        """ Uncount an action of the player that was turned down after it was counted (e.g., a job that
+            was refused), so that it does not count against the limit.
+        """
+        with self.__lock:
+            bucket = self.__buckets.get((player_name, rate_class))
+            if bucket is not None:
+                bucket.give_back()
+
+    def get_wait_message(self, wait_time: float) -> str:
+        """ Returns what to tell a player who has to wait wait_time seconds (see try_acquire). """
+        wait_s = f"{math.ceil(wait_time / 60)} minutes" if wait_time >= 60 else f"{math.ceil(wait_time)} seconds"
+        return f"You are doing this too often. Please wait {wait_s} and try again."
+
+rate_limiter = RateLimiter()
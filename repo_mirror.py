@@ -0,0 +1,91 @@
+import os
+import re
+import shutil
+import threading
+from typing import Optional
+
+from .util import lazy_import
+
+git = lazy_import('git')
+
+class RepoMirrorCache:
+    """ Keeps a bare mirror of each repository that is pulled, so that a pull only fetches the objects that
+        are new since the last one, and checks the requested branch out into a worktree of the mirror (which
+        shares the objects of the mirror instead of copying them). The least recently used mirrors beyond
+        MAX_MIRRORS are deleted, unless a checkout still uses them.
+    """
+    MIRROR_DIR = os.environ.get('REPO_MIRROR_DIR', './repo_mirrors')
+    MAX_MIRRORS = 200
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__mirror_locks: dict[str, threading.Lock] = {} # by mirror path, since partners pull the same repository
+
+    def __get_mirror_lock(self, path: str) -> threading.Lock:
+        with self.__lock:
+            if path not in self.__mirror_locks:
+                self.__mirror_locks[path] = threading.Lock()
+            return self.__mirror_locks[path]
+
+    def __get_mirror_path(self, key: str) -> str:
+        return os.path.join(self.MIRROR_DIR, re.sub(r'[^A-Za-z0-9_.-]', '@', key) + '.git')
+
+    def update_mirror(self, key: str, url: str, timeout: Optional[float] = None) -> "git.Repo":
+        """ Create the mirror of the repository at url, or fetch what is new into it. The url is given each
+            time rather than stored in the mirror, since it may contain credentials.
+
+        Arguments:
+            key: identifies the repository, e.g. user/name
+            url: where to fetch the repository from (anything git accepts, including a local path)
+            timeout: seconds after which git is killed (None for no limit)
+        """
+        path = self.__get_mirror_path(key)
+        if not os.path.exists(path):
+            os.makedirs(self.MIRROR_DIR, exist_ok=True)
+            mirror = git.Repo.init(path, bare=True)
+        else:
+            mirror = git.Repo(path)
+        mirror.git.fetch('--prune', '--force', url, '+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*', '+HEAD:refs/remotes/origin/HEAD', kill_after_timeout=timeout)
+        os.utime(path) # most recently used
+        return mirror
+
+    def checkout(self, key: str, url: str, checkout_dir: str, branch: Optional[str] = None, timeout: Optional[float] = None) -> None:
+        """ Update the mirror of the repository, then check out the branch (the default one if None) into
+            checkout_dir, replacing what was there. Raises git.GitCommandError if the repository or the
+            branch cannot be fetched, or if git takes more than timeout seconds (if not None) for either.
+        """
+        with self.__get_mirror_lock(self.__get_mirror_path(key)):
+            mirror = self.update_mirror(key, url, timeout=timeout)
+            revision = f'refs/heads/{branch}' if branch is not None else 'refs/remotes/origin/HEAD'
+            commit = mirror.git.rev_parse('--verify', revision + '^{commit}') # before removing the previous checkout
+            if os.path.exists(checkout_dir):
+                shutil.rmtree(checkout_dir)
+            mirror.git.worktree('prune')
+            os.makedirs(os.path.dirname(os.path.abspath(checkout_dir)), exist_ok=True)
+            mirror.git.worktree('add', '--detach', '--force', os.path.abspath(checkout_dir), commit, kill_after_timeout=timeout)
+        self.__evict()
+
+    def __has_worktrees(self, path: str) -> bool:
+        # whether checkouts still use the objects of the mirror (once the entries of deleted ones are pruned)
+        git.Repo(path).git.worktree('prune')
+        worktrees_dir = os.path.join(path, 'worktrees')
+        return os.path.isdir(worktrees_dir) and len(os.listdir(worktrees_dir)) > 0
+
+    def __evict(self) -> None:
+        # delete the least recently used mirrors beyond MAX_MIRRORS, except those that checkouts still use
+        if not os.path.isdir(self.MIRROR_DIR):
+            return
+        paths = [os.path.join(self.MIRROR_DIR, name) for name in os.listdir(self.MIRROR_DIR) if name.endswith('.git')]
+        if len(paths) <= self.MAX_MIRRORS:
+            return
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:len(paths) - self.MAX_MIRRORS]:
+            lock = self.__get_mirror_lock(path)
+            if lock.acquire(blocking=False): # skip the mirrors that are being used
+                try:
+                    if not self.__has_worktrees(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                finally:
+                    lock.release()
+
+repo_mirrors = RepoMirrorCache()
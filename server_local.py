@@ -3,18 +3,27 @@
 # Do not start this file. This file will be automatically called when you start client_local.py.
 
 import os
-import re
 import time
 import traceback
 import threading
 from queue import Queue
-from collections import defaultdict
+from typing import Optional
 
 LOCAL = True
 os.environ['LOCAL'] = "True"
 
 from .NPC import *
 from .message import *
+from .world import World
+from .checkpoint import Checkpointer
+from .command import ChatCommand
+from .command_runner import command_runner
+from .jobs import job_queue
+from .rate_limiter import rate_limiter
+from .file_server import file_server
+from .database import db
+from .user_directory import user_directory
+from .profiler import profiler
 from .maps.base import Map
 from .Player import HumanPlayer
 from .tiles.base import MapObject
@@ -22,17 +31,38 @@ from .util import get_subclasses_from_folders
 
 class ChatBackend(object):
     STARTING_ROOM = "Trottier Town"
+    ROOM_IDLE_TIMEOUT = 5 * 60 # seconds without players before a room is hibernated (None to disable)
+    BUILD_WORKERS = 1 # processes used to build the rooms at startup (None for one per core)
+    STARTUP_PROFILE = os.environ.get('STARTUP_PROFILE', '') # where to write the startup timeline (empty to disable)
+    HOT_RELOAD_INTERVAL = None # seconds between checks for changed map files to reload (None to disable)
+    CHECKPOINT_DIR = 'checkpoints' # where the runtime state of the world is saved (empty to disable)
+    CHECKPOINT_INTERVAL = 30 # seconds between checkpoints of the runtime state of the world
 
     def __init__(self):
-        classes = get_subclasses_from_folders([Map, MapObject])
-        MapObject.load_objects(classes[MapObject])
+        if len(ChatBackend.STARTUP_PROFILE) > 0:
+            profiler.enable()
 
-        self.__rooms: dict[str, Map] = self.__gen_layout(classes[Map])
-        self.__players: list[HumanPlayer] = []
-        self.__create_player()
+        with profiler.span('startup'):
+            with profiler.span('discover plugins'):
+                classes = get_subclasses_from_folders([Map, MapObject])
+            with profiler.span('load_objects'):
+                MapObject.load_objects(classes[MapObject])
 
+            checkpointer = Checkpointer(ChatBackend.CHECKPOINT_DIR) if len(ChatBackend.CHECKPOINT_DIR) > 0 else None
+            self.__world = World(classes[Map], idle_timeout=ChatBackend.ROOM_IDLE_TIMEOUT, build_workers=ChatBackend.BUILD_WORKERS, checkpointer=checkpointer)
+            self.__players: list[HumanPlayer] = []
+            self.__create_player()
+
+        if profiler.is_enabled():
+            profiler.save(ChatBackend.STARTUP_PROFILE)
+
+        file_server.start() # serves the files of FileMessages, in place of the remote host
         self.__message_inbox = Queue()
         self.__message_outbox = Queue()
+        # the messages of blocking commands are sent when they complete (the outbox is thread-safe)
+        command_runner.set_result_handler(self.__send_messages_to_recipients)
+        job_queue.set_message_handler(self.__send_messages_to_recipients)
+        job_queue.recover() # the jobs of the previous run were interrupted
         
         self.__rcv_t = threading.Thread(target=self.__run, args=(self.__message_inbox, self.__players[0]))
         self.__rcv_t.daemon = True
@@ -40,60 +70,6 @@ class ChatBackend(object):
         self.__event_t = threading.Thread(target=self.__event_loop)
         self.__event_t.daemon = True
 
-    def __gen_layout(self, room_classes) -> dict[str, Map]:
-        # get rooms from defined classes
-        all_rooms: dict[str, Map] = {}
-        for room_name, room_class in room_classes.items(): # + subclasses:
-            #print("Initializing room:", room_name)
-            if '_' in room_name:
-                room_name = room_name.replace("_", " ")
-            else:
-                room_name = re.sub(r"(\w)([A-Z])", r"\1 \2", room_name)
-            words = room_name.split()
-            for i, word in enumerate(words):
-                if 1 < len(word) <= 3 and not word.isupper():
-                    words[i] = words[i].lower()
-            room_name = ' '.join(words)
-            room_name = room_name[0].upper() + room_name[1:]
-
-            # initialize room
-            all_rooms[room_name] = room_class()
-        
-        # set exits
-        exits = defaultdict(list)
-        for room_name, room in all_rooms.items():
-            for exit in room.get_exits():
-                if len(exit.linked_map) == 0:
-                    continue
-                key = tuple(sorted([room_name, exit.linked_map]))
-                exits[key].append((room_name, exit.door, exit.door_position))
-        
-        for (loc1_s, loc2_s), doors in exits.items():
-            if len(doors) != 2:
-                print(f"Expected 2 doors, got {len(doors)}, for {loc1_s} and {loc2_s}.")
-                continue
-            
-            # Identify doors by their originating room.
-            # Note that key (loc1_s, loc2_s) is sorted, so loc1_s is the alphabetically first room.
-            # However, the stored room name may not be in that order.
-            door_info1, door_info2 = doors
-            room_from1, door1, door1_pos = door_info1
-            room_from2, door2, door2_pos = door_info2
-
-            # Now, decide which door belongs to which room:
-            if room_from1 == loc1_s:
-                # door1 came from loc1, door2 from loc2
-                door1.connect_to(all_rooms[loc2_s], door2_pos)
-                door2.connect_to(all_rooms[loc1_s], door1_pos)
-            elif room_from1 == loc2_s:
-                # door1 came from loc2, door2 from loc1
-                door1.connect_to(all_rooms[loc1_s], door2_pos)
-                door2.connect_to(all_rooms[loc2_s], door1_pos)
-            else:
-                raise ValueError("Unexpected room names in door pairing.")
-        
-        return all_rooms
-
     def __send_messages_to_recipients(self, messages: list[Message]):
         for x in messages:
             assert isinstance(x, Message), x
@@ -113,49 +89,92 @@ class ChatBackend(object):
         self.__send_messages_to_recipients([message])
 
     def __create_player(self):
-        room = self.__rooms[ChatBackend.STARTING_ROOM]
         new_player = HumanPlayer(websocket_state=None, name="Local user", email="") # type: ignore
-        new_player.change_room(room)
+        location = self.__world.get_checkpointed_location(new_player.get_name())
+        if location is not None: # back where they were before the server restarted
+            room, entry_point = location
+        else:
+            room, entry_point = self.__world.get_room(ChatBackend.STARTING_ROOM), None
+        new_player.change_room(room, entry_point=entry_point)
+        db.pin(new_player) # online players keep their state in memory
+        user_directory.player_connected(new_player)
         self.__players.append(new_player)
         print("New player added:", new_player)
         return new_player
 
+    def __remove_player(self, player: HumanPlayer):
+        user_directory.player_disconnected(player)
+        db.unpin(player)
+        if player in self.__players:
+            self.__players.remove(player)
+        print("Player disconnected:", player)
+
     def __send(self, player, message):
         self.__message_outbox.put(message)
     
+    def __get_rate_class(self, data_d, command: Optional[ChatCommand]) -> str:
+        """ Returns the class of the action in the message (see RateLimiter.RATE_CLASSES), given the command
+            that it runs, if any.
+        """
+        if 'move' in data_d:
+            return 'move'
+        if command is not None:
+            return command.rate_class
+        text = data_d.get('text', '')
+        if 'text' in data_d and not (len(text) > 0 and text[0] == '/'):
+            return 'chat'
+        return 'command'
+
     def __parse_message(self, data_d, player: HumanPlayer):
         print("Parsing message:", data_d)
 
         messages: list[Message] = []
 
-        try:
-            if 'move' in data_d:
-                key = data_d['move'].lower()
-                if key in ['left', 'right', 'up', 'down']:
-                    messages = player.move(key)
-                elif key == 'space':
-                    messages = player.interact()
-                else:
-                    messages = [ServerMessage(player, 'Invalid direction.')]
-            elif 'menu_option' in data_d:
-                messages = player.select_menu_option(data_d['menu_option'])
-            elif 'text' in data_d:
-                if len(data_d['text']) > 0 and data_d['text'][0] == '/': # server command
-                    # execute command
-                    messages: list[Message] = player.execute_command(data_d['text'][1:])
-
-                    notices = player.get_state('notices', [])
-                    if len(notices) > 0:
-                        notice_msg = "Notices:\n"
-                        for notice in notices:
-                            notice_msg += notice + "\n"
-                        messages += [ServerMessage(player, notice_msg)]
-                        player.set_state('notices', [])
-
-                else: # regular message
-                    messages = [ChatMessage(player, player.get_current_room(), data_d['text'])]
-        except:
-            messages = [ServerMessage(player, 'An error occurred processing your command: ' + traceback.format_exc())]
+        if data_d.get('type') == 'disconnect':
+            self.__remove_player(player)
+            return
+
+        with self.__world.dispatching(): # the room of the player is not rebuilt meanwhile
+            try:
+                # a command is looked up once, for both its rate limit and its execution
+                text = data_d.get('text', '')
+                is_command = 'text' in data_d and len(text) > 0 and text[0] == '/'
+                command = player.get_current_room().find_command(text[1:]) if is_command else None
+
+                wait_time = rate_limiter.try_acquire(player.get_name(), self.__get_rate_class(data_d, command))
+                if wait_time > 0:
+                    if 'move' in data_d: # moves are dropped silently, since clients may repeat them quickly
+                        return
+                    self.__send_messages_to_recipients([ServerMessage(player, rate_limiter.get_wait_message(wait_time))])
+                    return
+
+                if 'move' in data_d:
+                    key = data_d['move'].lower()
+                    if key in ['left', 'right', 'up', 'down']:
+                        messages = player.move(key)
+                    elif key == 'space':
+                        messages = player.interact()
+                    else:
+                        messages = [ServerMessage(player, 'Invalid direction.')]
+                elif 'menu_option' in data_d:
+                    messages = player.select_menu_option(data_d['menu_option'])
+                elif 'text' in data_d:
+                    if is_command: # server command
+                        # execute command
+                        messages: list[Message] = player.get_current_room().run_command(player, command, text[1:])
+
+                        notices = player.get_state('notices', [])
+                        if len(notices) > 0:
+                            notice_msg = "Notices:\n"
+                            for notice in notices:
+                                notice_msg += notice + "\n"
+                            messages += [ServerMessage(player, notice_msg)]
+                            player.set_state('notices', [])
+
+                    else: # regular message
+                        messages = [ChatMessage(player, player.get_current_room(), data_d['text'])]
+            except:
+                messages = [ServerMessage(player, 'An error occurred processing your command: ' + traceback.format_exc())]
 
         self.__send_messages_to_recipients(messages)
     
@@ -168,10 +187,20 @@ class ChatBackend(object):
             self.__parse_message(message, player)
     
     def __event_loop(self):
+        last_reload = time.time()
+        last_checkpoint = time.time()
         while True:
-            for room in self.__rooms.values():
-                messages = room.update()
-                self.__send_messages_to_recipients(messages)
+            messages = self.__world.update()
+            messages += job_queue.update() # stop the jobs that have timed out
+            self.__send_messages_to_recipients(messages)
+
+            if time.time() - last_checkpoint >= ChatBackend.CHECKPOINT_INTERVAL:
+                last_checkpoint = time.time()
+                self.__world.checkpoint()
+
+            if ChatBackend.HOT_RELOAD_INTERVAL is not None and time.time() - last_reload >= ChatBackend.HOT_RELOAD_INTERVAL:
+                last_reload = time.time()
+                self.__send_messages_to_recipients(self.__world.reload())
 
             time.sleep(1)
 
@@ -0,0 +1,83 @@
+import os
+import sys
+import importlib
+
+import pytest
+
+# the tests import the game as a package, by the name of its folder (like the servers do)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.basename(ROOT)
+if os.path.dirname(ROOT) not in sys.path:
+    sys.path.insert(0, os.path.dirname(ROOT))
+
+def import_package_module(name: str):
+    """ Returns the module of the game with the given name, e.g. import_package_module('blob_store'). """
+    return importlib.import_module(f'{PACKAGE}.{name}')
+
+@pytest.fixture
+def game_tree(tmp_path):
+    """ A folder laid out as the servers expect it (the game next to an external project with a .git folder),
+        with the game linked rather than copied. Returns the folder, to run the game from.
+    """
+    game_dir = tmp_path / PACKAGE
+    game_dir.mkdir()
+    for name in os.listdir(ROOT):
+        if name not in ('resources', 'tests', '__pycache__'):
+            os.symlink(os.path.join(ROOT, name), game_dir / name)
+
+    # the resources, with a song list for the trivia house
+    resources_dir = game_dir / 'resources'
+    resources_dir.mkdir()
+    source_dir = os.path.join(ROOT, 'resources') if os.path.isdir(os.path.join(ROOT, 'resources')) else os.path.join(ROOT, 'rsrc_cache')
+    for name in os.listdir(source_dir):
+        if name != 'sound':
+            os.symlink(os.path.join(source_dir, name), resources_dir / name)
+    (resources_dir / 'sound').mkdir()
+    if not (resources_dir / 'tswift_songs.csv').exists():
+        (resources_dir / 'tswift_songs.csv').write_text("Love Story\nShake It Off\nBlank Space\nStyle\nAnti-Hero\n")
+
+    (tmp_path / 'project' / '.git').mkdir(parents=True)
+    return tmp_path
+
+@pytest.fixture(scope='session')
+def local_db(tmp_path_factory):
+    """ The database of the game (the local one), with its files in a folder of its own. The folder stays
+        the working directory for the session, since the database opens its files by relative path.
+    """
+    import atexit
+    register = atexit.register
+    atexit.register = lambda *args, **kwargs: None # closed below instead, before the folder goes away
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('db'))
+    try:
+        db = import_package_module('database').db
+        yield db
+        db.close()
+    finally:
+        os.chdir(cwd)
+        atexit.register = register
+
+def make_database(kind: str, tmp_path, monkeypatch):
+    """ Returns a new database of the given backend, with its files in tmp_path, which the DatabaseEntity
+        objects use until the end of the test.
+    """
+    import atexit
+    monkeypatch.chdir(tmp_path) # the local database opens its files by relative path
+    monkeypatch.setattr(atexit, 'register', lambda *args, **kwargs: None)
+    if kind == 'local':
+        db = import_package_module('database_local').Database()
+        db.SYNC_INTERVAL = 3600 # no background work once the folder is gone
+    else:
+        db = import_package_module('database_sqlite').Database(str(tmp_path / 'state.sqlite3'))
+    monkeypatch.setattr(import_package_module('database_entity'), 'db', db)
+    return db
+
+@pytest.fixture(params=['local', 'sqlite'])
+def database(request, tmp_path, monkeypatch):
+    """ A new database of each backend (see make_database). """
+    return make_database(request.param, tmp_path, monkeypatch)
+
+@pytest.fixture
+def local_database(tmp_path, monkeypatch):
+    """ A new local database (see make_database). """
+    return make_database('local', tmp_path, monkeypatch)
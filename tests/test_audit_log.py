@@ -0,0 +1,66 @@
+import time
+import sqlite3
+
+from conftest import import_package_module
+
+audit_log = import_package_module('audit_log')
+
+class SlowAuditLog(audit_log.AuditLog):
+    """ Writes only when a batch is full (or when flushed). """
+    RING_SIZE = 10
+    BATCH_SIZE = 4
+    FLUSH_INTERVAL = 60
+
+def count_rows(path) -> int:
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute("SELECT COUNT(*) FROM audit_log").fetchone()[0]
+    except sqlite3.OperationalError: # not created yet
+        return 0
+    finally:
+        connection.close()
+
+def wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_records_are_written_in_batches(tmp_path):
+    path = str(tmp_path / 'audit.sqlite3')
+    log = SlowAuditLog(path)
+    for i in range(3):
+        log.record('pull', f'pull {i}', user='ada@example.com')
+    time.sleep(0.2)
+    assert count_rows(path) == 0 # waiting for a full batch
+
+    log.record('pull', 'pull 3', user='ada@example.com')
+    wait_for(lambda: count_rows(path) == 4)
+
+class StalledAuditLog(SlowAuditLog):
+    """ Never fills a batch, so it only writes when flushed. """
+    BATCH_SIZE = 100
+
+def test_the_oldest_records_are_dropped_when_the_writer_falls_behind(tmp_path):
+    log = StalledAuditLog(str(tmp_path / 'audit.sqlite3'))
+    for i in range(15):
+        log.record('chat', f'message {i}')
+    assert log.get_dropped_count() == 5
+    assert [record.message for record in log.query(limit=100)][-1] == 'message 5'
+
+def test_queries_by_user_and_event_use_the_indexes(tmp_path):
+    path = str(tmp_path / 'audit.sqlite3')
+    log = audit_log.AuditLog(path)
+    log.record('pull', 'pulled a/b', user='ada@example.com')
+    log.record('register', 'registered a/b', user='ada@example.com')
+    log.record('pull', 'pulled c/d', user='grace@example.com')
+
+    assert [record.message for record in log.query(user='ada@example.com')] == ['registered a/b', 'pulled a/b']
+    assert [record.user for record in log.query(event='pull')] == ['grace@example.com', 'ada@example.com']
+    assert log.query(user='ada@example.com', event='pull', limit=1)[0].message == 'pulled a/b'
+
+    connection = sqlite3.connect(path)
+    for column, index in (('user', 'audit_log_user'), ('event', 'audit_log_event')):
+        plan = connection.execute(f"EXPLAIN QUERY PLAN SELECT * FROM audit_log WHERE {column} = 'x' ORDER BY time DESC, id DESC").fetchall()
+        assert index in str(plan)
+    connection.close()
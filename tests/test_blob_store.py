@@ -0,0 +1,42 @@
+import os
+import zlib
+import hashlib
+
+import pytest
+
+from conftest import import_package_module
+
+blob_store = import_package_module('blob_store')
+
+@pytest.fixture
+def store(tmp_path):
+    store = blob_store.BlobStore()
+    store.BLOB_DIR = str(tmp_path)
+    return store
+
+def blob_files(root) -> list[str]:
+    return [os.path.join(folder, name) for folder, _, names in os.walk(root) for name in names]
+
+def test_identical_contents_are_stored_once(store, tmp_path):
+    data = b'int main() { return 0; }\n' * 100
+    digest = store.put(data)
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert store.put(data) == digest
+    assert len(blob_files(tmp_path)) == 1
+    assert os.path.getsize(blob_files(tmp_path)[0]) < len(data) # compressed
+    assert store.has(digest) and store.get(digest) == data
+
+def test_a_missing_blob_raises_key_error(store):
+    with pytest.raises(KeyError):
+        store.get(hashlib.sha256(b'nothing').hexdigest())
+
+@pytest.mark.parametrize('content', [zlib.compress(b'some other content'), b'not even compressed'])
+def test_a_corrupt_blob_is_detected_and_stored_again(store, tmp_path, content):
+    data = b'the right content'
+    digest = store.put(data)
+    with open(tmp_path / digest[:2] / digest[2:], 'wb') as f: # e.g., overwritten by mistake
+        f.write(content)
+    with pytest.raises(ValueError):
+        store.get(digest)
+    assert not store.has(digest)
+    assert store.put(data) == digest and store.get(digest) == data
@@ -0,0 +1,31 @@
+from conftest import import_package_module
+
+command = import_package_module('command')
+
+class PrefixCommand(command.ChatCommand):
+    @classmethod
+    def matches(cls, command_text: str) -> bool:
+        return any(command_text.startswith(name) for name in (cls.name,) + cls.aliases)
+
+    def execute(self, command_text, context, player):
+        return []
+
+class OCommand(PrefixCommand):
+    name = 'o'
+
+class OnlineCommand(PrefixCommand):
+    name = 'online'
+
+class GetProposalsCommand(PrefixCommand):
+    name = 'get_proposals'
+    aliases = ('get_propo',)
+
+def test_find_prefers_the_longest_name_and_knows_aliases():
+    index = command.CommandIndex([OCommand(), OnlineCommand(), GetProposalsCommand()])
+    assert type(index.find('online')) is OnlineCommand
+    assert type(index.find('o 1 2')) is OCommand
+    assert type(index.find('onl')) is OCommand
+    assert type(index.find('get_propo#ada')) is GetProposalsCommand
+    assert type(index.find('get_proposals#ada')) is GetProposalsCommand
+    assert index.find('get_prop') is None
+    assert index.find('jobs') is None
@@ -0,0 +1,38 @@
+import os
+
+from conftest import import_package_module
+
+csv_tables = import_package_module('csv_tables')
+
+def write_csv(path, text: str, mtime: float) -> None:
+    with open(path, 'w') as f:
+        f.write(text)
+    os.utime(path, (mtime, mtime))
+
+def test_lookups_use_the_index_and_the_last_row_wins():
+    table = csv_tables.CsvTable([{'Email': 'a@x', 'Group': '1'}, {'Email': 'b@x', 'Group': '1'}, {'Email': 'a@x', 'Group': '2'}])
+    assert [row['Group'] for row in table.find('Email', 'a@x')] == ['1', '2']
+    assert table.find_one('Email', 'a@x')['Group'] == '2'
+    assert table.find_one('Email', 'c@x') is None
+    assert sorted(table.get_values('Group')) == ['1', '2']
+
+def test_value_sets_are_stripped_and_computed_once():
+    table = csv_tables.CsvTable([{'Email': ' a@x '}, {'Email': 'b@x'}, {'Email': None}])
+    assert table.get_value_set('Email') == {'a@x', 'b@x'}
+    assert table.get_value_set('Email') is table.get_value_set('Email')
+
+def test_mappings_keep_the_last_row_and_are_computed_once():
+    table = csv_tables.CsvTable([{'Email': 'a@x', 'Group': '1'}, {'Email': 'b@x', 'Group': '1'}, {'Email': 'a@x', 'Group': '2'}])
+    assert table.get_mapping('Email', 'Group') == {'a@x': '2', 'b@x': '1'}
+    assert table.get_mapping('Email', 'Group') is table.get_mapping('Email', 'Group')
+
+def test_a_table_is_reloaded_when_its_file_changes(tmp_path):
+    cache = csv_tables.CsvTableCache()
+    cache.RELOAD_CHECK_INTERVAL = 0
+    path = str(tmp_path / 'groups.csv')
+    write_csv(path, "Email,Group\na@x,1\n", 1000)
+    table = cache.get_table(path)
+    assert cache.get_table(path) is table # unchanged, so not read again
+
+    write_csv(path, "Email,Group\na@x,2\n", 2000)
+    assert cache.get_table(path).find_one('Email', 'a@x')['Group'] == '2'
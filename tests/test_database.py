@@ -0,0 +1,116 @@
+import copy
+import threading
+
+from conftest import import_package_module
+
+database_local = import_package_module('database_local')
+DatabaseEntity = import_package_module('database_entity').DatabaseEntity
+
+class NPC(DatabaseEntity):
+    """ An entity stored like the NPCs (the database finds the type by class name). """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def get_name(self) -> str:
+        return self.name
+
+def test_get_value_reads_one_key(database):
+    npc = NPC('guide')
+    database.update_keys(npc, {'lines': ['hi', 'bye'], 'mood': 'happy'})
+    assert database.get_value(npc, 'lines') == ['hi', 'bye']
+    assert database.get_value(npc, 'missing', 'default') == 'default'
+    assert database.get_value(NPC('nobody'), 'lines') is None
+
+    database.get_value(npc, 'lines').append('changed') # a copy
+    assert npc.get_state('lines') == ['hi', 'bye']
+    assert npc.get_state('missing', []) == []
+
+def test_get_value_copies_only_the_value_it_reads(local_database, monkeypatch):
+    db = local_database
+    npc = NPC('big')
+    db.update_keys(npc, {'history': list(range(10000)), 'count': [1]})
+
+    copied = []
+    deepcopy = copy.deepcopy
+    monkeypatch.setattr(database_local.copy, 'deepcopy', lambda value: copied.append(value) or deepcopy(value))
+    assert db.get_value(npc, 'count') == [1]
+    assert copied == [[1]]
+
+def test_transaction_writes_its_changes_when_it_ends(database):
+    npc = NPC('guide')
+    npc.set_state('old', 1)
+    with npc.transaction():
+        npc.set_state('lines', ['hi'])
+        npc.increment('visits')
+        npc.delete_state('old')
+        assert database.get_state(npc) == {'old': 1} # nothing written yet
+    assert database.get_state(npc) == {'lines': ['hi'], 'visits': 1}
+
+def test_transaction_is_rolled_back_on_exception(database):
+    npc = NPC('guide')
+    npc.set_state('lines', ['hi'])
+    try:
+        with npc.transaction():
+            npc.set_state('lines', ['bye'])
+            npc.delete_state('lines')
+            raise ValueError()
+    except ValueError:
+        pass
+    assert database.get_state(npc) == {'lines': ['hi']}
+
+    npc.set_state('mood', 'calm') # later writes are not part of the failed transaction
+    assert database.get_state(npc) == {'lines': ['hi'], 'mood': 'calm'}
+
+def test_nested_transaction_joins_the_outer_one(database):
+    npc = NPC('guide')
+    with npc.transaction():
+        with npc.transaction():
+            npc.set_state('inner', 1)
+        assert database.get_state(npc) == {} # written by the outer transaction only
+        npc.set_state('outer', 2)
+    assert database.get_state(npc) == {'inner': 1, 'outer': 2}
+
+def test_get_state_sees_pending_values(database):
+    npc = NPC('guide')
+    npc.set_state('lines', ['hi'])
+    npc.set_state('mood', 'calm')
+    with npc.transaction():
+        npc.set_state('lines', ['bye'])
+        npc.delete_state('mood')
+        assert npc.get_state('lines') == ['bye']
+        assert npc.get_state('mood', 'none') == 'none'
+        assert npc.append('lines', 'again') == ['bye', 'again']
+        assert NPC('other').get_state('lines', None) is None # only for this entity
+    assert npc.get_state('lines') == ['bye', 'again']
+    assert npc.get_state('mood', 'none') == 'none'
+
+def test_atomic_operations_return_the_new_value(database):
+    npc = NPC('guide')
+    assert npc.increment('visits') == 1 # from 0 when unset
+    assert npc.increment('visits', 5) == 6
+    assert npc.append('lines', 'hi') == ['hi'] # from [] when unset
+    assert npc.append('lines', 'bye') == ['hi', 'bye']
+    assert npc.add_to_set('friends', 'a') == ['a']
+    assert npc.add_to_set('friends', 'a') == ['a']
+    assert npc.add_to_set('friends', 'b') == ['a', 'b']
+    assert npc.remove('lines', 'hi') == ['bye']
+    assert npc.remove('lines', 'absent') == ['bye']
+    assert npc.remove('unset', 'absent') == []
+    assert npc.modify_state('mood', lambda value: value + '!', 'calm') == 'calm!'
+    assert database.get_state(npc) == {
+        'visits': 6, 'lines': ['bye'], 'friends': ['a', 'b'], 'unset': [], 'mood': 'calm!',
+    }
+
+def test_concurrent_increments_add_up(database):
+    THREADS, INCREMENTS = 8, 50
+    npc = NPC('guide')
+    def work() -> None:
+        for _ in range(INCREMENTS):
+            npc.increment('visits')
+    threads = [threading.Thread(target=work) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert npc.get_state('visits') == THREADS*INCREMENTS
@@ -0,0 +1,167 @@
+import os
+import atexit
+import pickle
+import threading
+
+import pytest
+
+from conftest import import_package_module
+
+database_local = import_package_module('database_local')
+UserRecord = import_package_module('database_base').UserRecord
+DatabaseEntity = import_package_module('database_entity').DatabaseEntity
+
+class NPC(DatabaseEntity):
+    """ An entity stored like the NPCs (the database finds the type by class name). """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def get_name(self) -> str:
+        return self.name
+
+def open_database():
+    """ Returns a new local database on the files of the current folder (e.g., to check what was written). """
+    db = database_local.Database()
+    db.SYNC_INTERVAL = 3600 # no background work once the folder is gone
+    return db
+
+def run_threads(*targets) -> None:
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def write_journal(path: str, changes: list[dict]) -> None:
+    with open(path, 'wb') as f:
+        for updates in changes:
+            database_local.write_record(f, 'ada', pickle.dumps((updates, [])))
+
+def test_a_compaction_interrupted_twice_loses_no_change(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(atexit, 'register', lambda f: None)
+
+    # a compaction was interrupted after rotating the journal, and more changes were journaled since
+    write_journal('user_state.pkl.journal.old', [{'x': 1}])
+    write_journal('user_state.pkl.journal', [{'y': 2}])
+
+    # the compaction on opening is interrupted too, before its snapshot is in place
+    replace = os.replace
+    def crash_on_snapshot(src, dst):
+        if src.endswith('.tmp'):
+            raise OSError('crash')
+        replace(src, dst)
+    monkeypatch.setattr(os, 'replace', crash_on_snapshot)
+    with pytest.raises(OSError):
+        open_database().get_state(UserRecord('ada'))
+    monkeypatch.setattr(os, 'replace', replace)
+
+    db = open_database()
+    assert db.get_state(UserRecord('ada')) == {'x': 1, 'y': 2}
+    assert not os.path.exists('user_state.pkl.journal.old')
+
+def test_concurrent_changes_to_one_key_lose_no_update(local_database):
+    THREADS, CHANGES = 8, 100
+    npc = NPC('guide')
+    def work(thread: int) -> None:
+        for i in range(CHANGES):
+            npc.increment('visits')
+            npc.append('lines', (thread, i))
+    run_threads(*[lambda thread=thread: work(thread) for thread in range(THREADS)])
+
+    assert npc.get_state('visits') == THREADS*CHANGES
+    assert sorted(npc.get_state('lines')) == [(thread, i) for thread in range(THREADS) for i in range(CHANGES)]
+
+    # and the journal holds the same changes
+    assert open_database().get_value(npc, 'visits') == THREADS*CHANGES
+
+def test_concurrent_updates_of_different_keys_keep_every_update(local_database):
+    THREADS, UPDATES = 8, 100
+    npc = NPC('guide')
+    def work(thread: int) -> None:
+        for i in range(UPDATES):
+            local_database.update_keys(npc, {f'key{thread}': i})
+    run_threads(*[lambda thread=thread: work(thread) for thread in range(THREADS)])
+
+    expected = {f'key{thread}': UPDATES-1 for thread in range(THREADS)}
+    assert local_database.get_state(npc) == expected
+    assert open_database().get_state(npc) == expected
+
+def test_a_writer_does_not_block_the_other_entities(local_database):
+    get_stripe = local_database._Database__get_stripe
+    busy = NPC('busy')
+    busy.set_state('mood', 'angry')
+    other = next(NPC(f'npc{i}') for i in range(1000) if get_stripe('npc_state.pkl', f'npc{i}') is not get_stripe('npc_state.pkl', 'busy'))
+
+    with get_stripe('npc_state.pkl', 'busy'): # as if a write to busy was in progress
+        blocked = threading.Thread(target=lambda: busy.set_state('mood', 'calm'))
+        blocked.start()
+        free = threading.Thread(target=lambda: other.set_state('mood', 'calm'))
+        free.start()
+        free.join(timeout=5)
+        assert not free.is_alive()
+        assert other.get_state('mood') == 'calm'
+        assert busy.get_state('mood') == 'angry' # reads of cached states do not wait for the writer either
+        assert blocked.is_alive()
+    blocked.join(timeout=5)
+    assert busy.get_state('mood') == 'calm'
+
+def fill_cache(db, count: int) -> list:
+    db.MAX_RESIDENT_BYTES = 10_000
+    db.MAX_RESIDENT_STATE_BYTES = 5_000
+    npcs = [NPC(f'npc{i}') for i in range(count)]
+    for i, npc in enumerate(npcs):
+        npc.set_state('text', str(i) * 1000)
+    return npcs
+
+def test_the_cache_stays_within_its_size_limit(local_database):
+    db = local_database
+    npcs = fill_cache(db, 100)
+    db.compact('npc_state.pkl') # dirty states cannot be evicted until they are in the snapshot
+
+    cache = db._Database__cache['npc_state.pkl']
+    assert db._Database__cache_sizes['npc_state.pkl'] == sum(cached.size for cached in cache.values())
+    assert db._Database__cache_sizes['npc_state.pkl'] <= db.MAX_RESIDENT_BYTES
+    assert 'npc99' in cache and 'npc0' not in cache # the least recently used are evicted first
+
+    for i, npc in enumerate(npcs): # reading the evicted states back does not grow the cache either
+        assert npc.get_state('text') == str(i) * 1000
+        assert db._Database__cache_sizes['npc_state.pkl'] <= db.MAX_RESIDENT_BYTES
+
+def test_pinned_states_are_never_evicted(local_database):
+    db = local_database
+    npcs = fill_cache(db, 100)
+    large = NPC('large')
+    large.set_state('text', 'x' * 8000) # over the size limit of a single state
+    for npc in npcs[:5] + [large]:
+        db.pin(npc)
+    db.compact('npc_state.pkl')
+    for npc in npcs[5:]:
+        npc.get_state('text')
+
+    cache = db._Database__cache['npc_state.pkl']
+    assert all(npc.get_name() in cache for npc in npcs[:5] + [large])
+
+    db.unpin(large)
+    npcs[0].get_state('text')
+    assert 'large' in cache # unpinned, but cached until the next eviction
+    npcs[50].get_state('text') # was evicted, so reading it back evicts others
+    assert 'large' not in cache
+    assert large.get_state('text') == 'x' * 8000
+
+def test_evicted_states_are_read_back_from_the_snapshot_and_journal(local_database):
+    db = local_database
+    npcs = fill_cache(db, 100)
+    db.compact('npc_state.pkl')
+    assert 'npc0' not in db._Database__cache['npc_state.pkl']
+
+    npcs[0].append('lines', 'hi') # read from the snapshot, then changed in the journal only
+    npcs[1].delete_state('text')
+    assert npcs[0].get_state('text') == '0' * 1000
+    assert npcs[0].get_state('lines') == ['hi']
+
+    reopened = open_database()
+    assert reopened.get_state(npcs[0]) == {'text': '0' * 1000, 'lines': ['hi']}
+    assert reopened.get_state(npcs[1]) == {}
+    assert all(reopened.get_value(npc, 'text') == str(i) * 1000 for i, npc in enumerate(npcs) if i > 1)
@@ -0,0 +1,59 @@
+import sqlite3
+import threading
+
+import pytest
+
+from conftest import import_package_module
+
+database_sqlite = import_package_module('database_sqlite')
+UserRecord = import_package_module('database_base').UserRecord
+
+@pytest.fixture
+def db(tmp_path):
+    return database_sqlite.Database(str(tmp_path / 'state.sqlite3'))
+
+def test_modify_value_returns_the_value_as_stored(db):
+    user = UserRecord('ada')
+    assert db.modify_value(user, 'repo', lambda value: ('ada', 'game'), None) == ['ada', 'game']
+    assert db.get_state(user) == {'repo': ['ada', 'game']}
+    assert db.modify_value(user, 'scores', lambda value: {**value, 1: 'one'}, {}) == {'1': 'one'}
+
+def test_the_database_is_in_wal_mode(db, tmp_path):
+    db.update_keys(UserRecord('ada'), {'email': 'ada@example.com'})
+    connection = sqlite3.connect(str(tmp_path / 'state.sqlite3'))
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    connection.close()
+
+def test_writes_take_the_write_lock_up_front_and_reads_do_not_wait(db, tmp_path):
+    user = UserRecord('ada')
+    db.update_keys(user, {'count': 1})
+    db.BUSY_TIMEOUT = 0.1
+
+    other = sqlite3.connect(str(tmp_path / 'state.sqlite3'), isolation_level=None)
+    other.execute("BEGIN IMMEDIATE") # another writer holds the lock
+    try:
+        results = {'modified': 0}
+        def modify(value):
+            results['modified'] += 1
+            return value + 1
+        def write():
+            try:
+                db.modify_value(user, 'count', modify, 0)
+            except sqlite3.OperationalError as e:
+                results['error'] = str(e)
+        thread = threading.Thread(target=write) # with a new connection, so that BUSY_TIMEOUT applies
+        thread.start()
+        thread.join(5)
+        assert 'locked' in results['error']
+        assert results['modified'] == 0 # the lock was requested before the value was read
+        assert db.get_state(user) == {'count': 1}
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+    assert db.modify_value(user, 'count', lambda value: value + 1, 0) == 2
+
+def test_get_all_users_lists_the_players_with_their_email(db):
+    db.update_keys(UserRecord('ada'), {'email': 'ada@example.com', 'repo': ['ada', 'game']})
+    db.update_keys(UserRecord('grace'), {'repo': ['grace', 'compiler']})
+    users = sorted(db.get_all_users(), key=lambda user: user.name)
+    assert [(user.name, user.email) for user in users] == [('ada', 'ada@example.com'), ('grace', '')]
@@ -0,0 +1,75 @@
+import os
+import hashlib
+
+import pytest
+import requests
+
+from conftest import import_package_module
+
+resources = import_package_module('resources')
+file_server = import_package_module('file_server')
+file_downloader = import_package_module('file_downloader')
+
+CONTENT = bytes(range(256)) * 1000 # several chunks
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(resources, 'root_folder', str(tmp_path))
+    os.makedirs(tmp_path / 'resources' / 'sound')
+    with open(tmp_path / 'resources' / 'sound' / 'song.mp3', 'wb') as f:
+        f.write(CONTENT)
+    (tmp_path / 'secret.txt').write_text('secret')
+    server = file_server.FileServer()
+    server.start()
+    yield server
+    server.stop()
+
+def get(server, path: str, range_header=None) -> requests.Response:
+    return requests.get(server.get_base_url() + path, headers={'Range': range_header} if range_header else {}, timeout=5)
+
+@pytest.mark.parametrize('range_header, start, end', [('bytes=10-19', 10, 19), ('bytes=1000-', 1000, len(CONTENT) - 1), ('bytes=-5', len(CONTENT) - 5, len(CONTENT) - 1)])
+def test_ranges_are_served_partially(server, range_header, start, end):
+    response = get(server, 'sound/song.mp3', range_header)
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes {start}-{end}/{len(CONTENT)}'
+    assert response.content == CONTENT[start:end + 1]
+
+def test_whole_files_unsatisfiable_ranges_and_missing_files(server):
+    assert get(server, 'sound/song.mp3').content == CONTENT
+    response = get(server, 'sound/song.mp3', f'bytes={len(CONTENT)}-')
+    assert response.status_code == 416 and response.headers['Content-Range'] == f'bytes */{len(CONTENT)}'
+    assert get(server, 'sound/nothing.mp3').status_code == 404
+    assert get(server, '%2e%2e/secret.txt').status_code == 404 # outside of the resources
+    assert server.get_file_info('sound/song.mp3') == (len(CONTENT), hashlib.sha256(CONTENT).hexdigest())
+
+def test_an_interrupted_download_resumes_with_a_range_request(server, tmp_path, monkeypatch):
+    dest = str(tmp_path / 'song.mp3')
+    with open(dest + '.part', 'wb') as f: # what an interrupted download left
+        f.write(CONTENT[:3000])
+    requested_ranges = []
+    get = requests.get
+    def spy(url, headers, **kwargs):
+        requested_ranges.append(headers.get('Range'))
+        return get(url, headers=headers, **kwargs)
+    monkeypatch.setattr(file_downloader.requests, 'get', spy)
+
+    downloader = file_downloader.FileDownloader()
+    size, sha256 = server.get_file_info('sound/song.mp3')
+    downloader.download_now(server.get_base_url() + 'sound/song.mp3', dest, size, sha256)
+    assert requested_ranges == ['bytes=3000-']
+    assert open(dest, 'rb').read() == CONTENT and not os.path.exists(dest + '.part')
+
+    # the file is on disk with the right hash, so it is not downloaded again
+    downloader.download_now(server.get_base_url() + 'sound/song.mp3', dest, size, sha256)
+    assert requested_ranges == ['bytes=3000-']
+
+def test_a_corrupted_download_is_discarded(server, tmp_path):
+    dest = str(tmp_path / 'song.mp3')
+    with open(dest + '.part', 'wb') as f: # a prefix that does not match the file
+        f.write(b'x' * 3000)
+    size, sha256 = server.get_file_info('sound/song.mp3')
+    with pytest.raises(Exception, match='hash mismatch'):
+        file_downloader.FileDownloader().download_now(server.get_base_url() + 'sound/song.mp3', dest, size, sha256)
+    assert not os.path.exists(dest) and not os.path.exists(dest + '.part')
+    file_downloader.FileDownloader().download_now(server.get_base_url() + 'sound/song.mp3', dest, size, sha256)
+    assert open(dest, 'rb').read() == CONTENT
@@ -0,0 +1,69 @@
+import json
+import time
+import threading
+
+from conftest import import_package_module
+
+jobs = import_package_module('jobs')
+HumanPlayer = import_package_module('Player').HumanPlayer
+
+def wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+def make_queue() -> tuple["jobs.JobQueue", list]:
+    queue = jobs.JobQueue()
+    messages: list = []
+    queue.set_message_handler(messages.extend)
+    return queue, messages
+
+def blocking_job(started: threading.Event, release: threading.Event):
+    def run(job):
+        started.set()
+        release.wait(5)
+        return []
+    return run
+
+def test_a_cancelled_job_keeps_its_slot_until_it_returns(local_db):
+    queue, _ = make_queue()
+    player = HumanPlayer('job_owner')
+    started, release = threading.Event(), threading.Event()
+    first, _ = queue.submit(player, 'pull', blocking_job(started, release))
+    second, messages = queue.submit(player, 'build', lambda job: [])
+    started.wait(5)
+    assert first.status == 'running'
+    assert second.status == 'queued' and 'number 1 in the queue' in json.loads(messages[0].prepare())['text']
+
+    queue.cancel(player, first.job_id)
+    assert first.status == 'cancelled'
+    assert second.status == 'queued' # the player still has a job running
+    refused, messages = queue.submit(player, 'pull', lambda job: [])
+    assert refused is None and 'still stopping' in json.loads(messages[0].prepare())['text']
+
+    release.set()
+    wait_for(lambda: second.status == 'done')
+    assert queue.get_jobs(player) == []
+
+def test_a_job_that_runs_too_long_is_stopped(local_db):
+    queue, messages = make_queue()
+    player = HumanPlayer('slow_owner')
+    def run(job):
+        while True:
+            job.check()
+            time.sleep(0.01)
+    job, _ = queue.submit(player, 'pull', run, timeout=0.1)
+    wait_for(lambda: job.is_finished() and queue.get_jobs(player) == [])
+    assert job.status == 'timed out'
+    assert any('took too long' in json.loads(message.prepare())['text'] for message in messages)
+
+def test_queued_jobs_per_player_are_limited(local_db):
+    queue, _ = make_queue()
+    player = HumanPlayer('busy_owner')
+    started, release = threading.Event(), threading.Event()
+    queue.submit(player, 'job0', blocking_job(started, release))
+    accepted = [queue.submit(player, f'job{i}', lambda job: [])[0] for i in range(1, queue.MAX_QUEUED_PER_USER + 2)]
+    assert all(job is not None for job in accepted[:-1])
+    assert accepted[-1] is None
+    release.set()
@@ -0,0 +1,24 @@
+import os
+import sys
+import json
+import subprocess
+
+from conftest import PACKAGE
+
+# heavy dependencies that only some features need; they must be imported lazily (see util.lazy_import)
+HEAVY_MODULES = ['PIL', 'git', 'requests', 'yt_dlp']
+
+BOOT_SCRIPT = f"""
+import sys, json
+from {PACKAGE}.server_local import ChatBackend
+ChatBackend()
+print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))
+"""
+
+def test_booting_the_backend_does_not_import_heavy_modules(game_tree):
+    # in a fresh interpreter, since other tests may have imported these modules
+    env = dict(os.environ, PYTHONPATH=str(game_tree), MEDIA_SOURCE_DIR=str(game_tree / 'media'), DATABASE='local')
+    result = subprocess.run([sys.executable, '-c', BOOT_SCRIPT], cwd=game_tree, env=env, capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stderr
+    imported = json.loads(result.stdout.strip().splitlines()[-1])
+    assert imported == []
@@ -0,0 +1,59 @@
+import os
+import time
+import threading
+
+from conftest import import_package_module
+
+resources = import_package_module('resources')
+media_cache = import_package_module('media_cache')
+
+class StubFetcher(media_cache.MediaFetcher):
+    """ Writes the query as the content of the sound, once allowed to; fails for queries starting with 'bad'. """
+
+    def __init__(self) -> None:
+        self.allowed = threading.Event()
+        self.queries: list[str] = []
+
+    def fetch(self, query: str, path: str) -> None:
+        self.queries.append(query)
+        self.allowed.wait(5)
+        if query.startswith('bad'):
+            raise FileNotFoundError(query)
+        with open(path + '.mp3', 'w') as f:
+            f.write(query)
+
+def wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_sounds_are_fetched_once_in_the_background(tmp_path, monkeypatch):
+    monkeypatch.setattr(resources, 'root_folder', str(tmp_path))
+    fetcher = StubFetcher()
+    cache = media_cache.MediaCache(fetcher)
+    names = ['songs/0', 'songs/1']
+
+    cache.prefetch({'songs/0': 'love story', 'songs/1': 'style'}) # returns without waiting
+    assert cache.get_cached(names) == []
+    cache.prefetch({'songs/0': 'love story', 'songs/1': 'style'})
+
+    fetcher.allowed.set()
+    wait_for(lambda: cache.get_cached(names) == names)
+    assert sorted(fetcher.queries) == ['love story', 'style']
+    assert open(tmp_path / 'resources' / 'sound' / 'songs' / '0.mp3').read() == 'love story'
+    assert not any(name.endswith('.download.mp3') for name in os.listdir(tmp_path / 'resources' / 'sound' / 'songs'))
+
+def test_a_failed_fetch_is_retried_on_the_next_prefetch(tmp_path, monkeypatch):
+    monkeypatch.setattr(resources, 'root_folder', str(tmp_path))
+    fetcher = StubFetcher()
+    fetcher.allowed.set()
+    cache = media_cache.MediaCache(fetcher)
+
+    cache.prefetch({'songs/0': 'bad query'})
+    wait_for(lambda: len(fetcher.queries) == 1)
+    time.sleep(0.1)
+    assert not cache.is_cached('songs/0')
+
+    cache.prefetch({'songs/0': 'bad query'})
+    wait_for(lambda: len(fetcher.queries) == 2)
@@ -0,0 +1,34 @@
+from conftest import import_package_module
+
+NPC = import_package_module('NPC').NPC
+HumanPlayer = import_package_module('Player').HumanPlayer
+Coord = import_package_module('coord').Coord
+
+def meet(npc, email: str) -> list:
+    """ Moves a player with the given email in front of the NPC (which looks down at them). """
+    player = HumanPlayer(email.split('@')[0], email=email)
+    player._current_position = npc._current_position + Coord(1, 0)
+    return npc.player_moved(player)
+
+def test_only_the_new_player_is_written(local_database, monkeypatch):
+    npc = NPC('guide', 'prof', 'Hello!', staring_distance=1)
+    assert len(meet(npc, 'ada@mail.com')) > 0
+
+    writes = []
+    update_keys = local_database.update_keys
+    monkeypatch.setattr(local_database, 'update_keys', lambda obj, updates, deletes=(): writes.append(updates) or update_keys(obj, updates, deletes))
+    assert len(meet(npc, 'bob@mail.com')) > 0
+    assert writes == [{'talked_to/bob@mail.com': True}]
+
+    assert meet(npc, 'bob@mail.com') == [] # done talking
+    assert writes == [{'talked_to/bob@mail.com': True}]
+
+def test_talked_to_players_are_loaded_back(local_database):
+    NPC('guide', 'prof', 'Hello!', staring_distance=1).set_state('talked_to_players', ['old@mail.com']) # as stored before
+    meet(NPC('guide', 'prof', 'Hello!', staring_distance=1), 'ada@mail.com')
+
+    npc = NPC('guide', 'prof', 'Hello!', staring_distance=1) # e.g., after the room was rebuilt
+    assert npc.done_talking(HumanPlayer('ada', email='ada@mail.com'))
+    assert npc.done_talking(HumanPlayer('old', email='old@mail.com'))
+    assert not npc.done_talking(HumanPlayer('bob', email='bob@mail.com'))
+    assert len(meet(npc, 'bob@mail.com')) > 0
@@ -0,0 +1,31 @@
+from conftest import import_package_module
+
+rate_limiter = import_package_module('rate_limiter')
+
+def test_a_bucket_allows_a_burst_then_refills_at_its_rate(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', lambda: now[0])
+    bucket = rate_limiter.TokenBucket(capacity=3, rate=2)
+    assert [bucket.try_take() for _ in range(3)] == [0, 0, 0]
+    assert bucket.try_take() == 0.5 # one token at 2 per second
+
+    now[0] += 0.5
+    assert bucket.try_take() == 0
+    now[0] += 60 # refilled up to the capacity only
+    assert [bucket.try_take() for _ in range(4)][-1] > 0
+
+def test_a_refund_gives_back_the_token_of_an_action_that_was_turned_down():
+    limiter = rate_limiter.RateLimiter()
+    capacity, _ = limiter.RATE_CLASSES['job']
+    for _ in range(int(capacity)):
+        assert limiter.try_acquire('ada', 'job') == 0
+    assert limiter.try_acquire('ada', 'job') > 60
+    assert limiter.try_acquire('grace', 'job') == 0 # buckets are per player
+
+    limiter.refund('ada', 'job')
+    assert limiter.try_acquire('ada', 'job') == 0
+
+def test_the_wait_message_rounds_up():
+    limiter = rate_limiter.RateLimiter()
+    assert 'wait 2 seconds' in limiter.get_wait_message(1.2)
+    assert 'wait 6 minutes' in limiter.get_wait_message(360)
@@ -0,0 +1,52 @@
+import os
+import shutil
+
+import git
+
+from conftest import import_package_module
+
+repo_mirror = import_package_module('repo_mirror')
+
+def make_bare_repo(path, text: str) -> str:
+    """ Returns the path of a bare repository whose default branch has one commit with a README. """
+    work = git.Repo.init(f'{path}.work')
+    with open(os.path.join(work.working_dir, 'README'), 'w') as f:
+        f.write(text)
+    work.index.add(['README'])
+    work.index.commit('first', author=git.Actor('a', 'a@example.com'), committer=git.Actor('a', 'a@example.com'))
+    git.Repo.clone_from(work.working_dir, str(path), bare=True)
+    return str(path)
+
+def test_eviction_keeps_the_mirrors_that_checkouts_use(tmp_path):
+    cache = repo_mirror.RepoMirrorCache()
+    cache.MIRROR_DIR = str(tmp_path / 'mirrors')
+    cache.MAX_MIRRORS = 1
+    urls = {name: make_bare_repo(tmp_path / f'{name}.git', name) for name in ('a', 'b', 'c')}
+
+    cache.checkout('u/a', urls['a'], str(tmp_path / 'repo' / 'a'))
+    cache.checkout('u/b', urls['b'], str(tmp_path / 'repo' / 'b'))
+    # a is the least recently used, but its checkout still needs it
+    assert sorted(os.listdir(cache.MIRROR_DIR)) == ['u@a.git', 'u@b.git']
+    assert open(tmp_path / 'repo' / 'a' / 'README').read() == 'a'
+
+    # once its checkout is gone, it can be evicted; b cannot
+    shutil.rmtree(str(tmp_path / 'repo' / 'a'))
+    cache.checkout('u/c', urls['c'], str(tmp_path / 'repo' / 'c'))
+    assert sorted(os.listdir(cache.MIRROR_DIR)) == ['u@b.git', 'u@c.git']
+    assert open(tmp_path / 'repo' / 'b' / 'README').read() == 'b'
+
+def test_checkout_fetches_new_commits_into_the_mirror(tmp_path):
+    cache = repo_mirror.RepoMirrorCache()
+    cache.MIRROR_DIR = str(tmp_path / 'mirrors')
+    url = make_bare_repo(tmp_path / 'a.git', 'one')
+    cache.checkout('u/a', url, str(tmp_path / 'repo'))
+
+    work = git.Repo(f'{url}.work')
+    with open(os.path.join(work.working_dir, 'README'), 'w') as f:
+        f.write('two')
+    work.index.add(['README'])
+    work.index.commit('second', author=git.Actor('a', 'a@example.com'), committer=git.Actor('a', 'a@example.com'))
+    work.git.push(url, 'HEAD')
+
+    cache.checkout('u/a', url, str(tmp_path / 'repo'))
+    assert open(tmp_path / 'repo' / 'README').read() == 'two'
@@ -0,0 +1,28 @@
+from conftest import import_package_module
+
+upload_house = import_package_module('maps.upload_house')
+csv_tables = import_package_module('csv_tables')
+HumanPlayer = import_package_module('Player').HumanPlayer
+
+class Room:
+    """ Stands in for the room, with the repositories registered so far. """
+
+    def __init__(self, repos: list) -> None:
+        self.repos = repos
+
+    def get_state(self, key: str, default=None):
+        return self.repos if key == 'repos' else default
+
+def test_a_repository_registered_by_a_partner_is_accepted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(upload_house, 'csv_tables', csv_tables.CsvTableCache())
+    # ada and bob swapped groups, so only the last row of each email counts
+    (tmp_path / 'groups.csv').write_text("Email,Group\nada@x,1\nbob@x,2\ncy@x,2\nada@x,2\nbob@x,1\n")
+    room = Room([('bob@x', 'bob', 'old'), ('cy@x', 'cy', 'game')])
+    command = upload_house.RegisterRepoCommand()
+    ada = HumanPlayer('ada', email='ada@x')
+
+    assert command.is_repo_valid(room, ada, 'cy/game', 'ada') == ""
+    assert command.is_repo_valid(room, ada, 'bob/old', 'ada') == "Error: This repository has already been registered by bob@x."
+    stranger = HumanPlayer('dee', email='dee@x') # not in any group
+    assert command.is_repo_valid(room, stranger, 'cy/game', 'dee') == "Error: This repository has already been registered by cy@x."
@@ -0,0 +1,16 @@
+from conftest import import_package_module
+
+user_directory = import_package_module('user_directory')
+UserRecord = import_package_module('database_base').UserRecord
+
+def test_handles_that_differ_by_case_are_distinct_users(monkeypatch):
+    users = [UserRecord('Ada', 'ada@example.com'), UserRecord('ada', 'other@example.com'), UserRecord('Grace', 'grace@example.com')]
+    monkeypatch.setattr(user_directory.db, 'get_all_users', lambda: users)
+    directory = user_directory.UserDirectory()
+
+    assert sorted(directory.get_handles()) == ['Ada', 'Grace', 'ada']
+    assert directory.get_user('Ada').email == 'ada@example.com'
+    assert directory.get_user('ada').email == 'other@example.com'
+    assert directory.get_user('ADA') is None # ambiguous
+    assert directory.get_user('grace').name == 'Grace'
+    assert directory.get_user_by_email('other@example.com').name == 'ada'
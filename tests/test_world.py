@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import textwrap
+import subprocess
+
+from conftest import PACKAGE
+
+# two small rooms of the external project, linked by a door, each with an NPC whose facing direction
+# is part of the runtime state of the room. the hall has a blocking command, which waits to be released.
+ROOMS = f"""
+import threading
+
+from {PACKAGE}.NPC import NPC
+from {PACKAGE}.coord import Coord
+from {PACKAGE}.maps.base import Map
+from {PACKAGE}.command import ChatCommand
+from {PACKAGE}.message import ServerMessage
+from {PACKAGE}.tiles.map_objects import Door
+
+class SlowCommand(ChatCommand):
+    name = 'slow'
+    desc = 'Answer once released.'
+    blocking = True
+    release = threading.Event()
+
+    @classmethod
+    def matches(cls, command_text: str) -> bool:
+        return command_text.startswith('slow')
+
+    def execute(self, command_text, context, player):
+        SlowCommand.release.wait(10)
+        return [ServerMessage(player, f'Done on {{threading.current_thread().name}}.')]
+
+class TestHall(Map):
+    def __init__(self) -> None:
+        super().__init__(name='Test Hall', description='A hall.', size=(7, 7), entry_point=Coord(2, 2), chat_commands=[SlowCommand])
+
+    def get_objects(self):
+        return [(Door('int_entrance', linked_room='Test Garden'), Coord(2, 5)), (NPC('Hall guide', 'prof', 'Hello!'), Coord(0, 0))]
+
+class TestGarden(Map):
+    def __init__(self) -> None:
+        super().__init__(name='Test Garden', description='A garden.', size=(7, 7), entry_point=Coord(2, 2))
+
+    def get_objects(self):
+        return [(Door('int_entrance', linked_room='Test Hall'), Coord(2, 0)), (NPC('Garden guide', 'prof', 'Hello!'), Coord(5, 5))]
+"""
+
+PRELUDE = f"""
+import os, json, threading
+from {PACKAGE}.NPC import NPC
+from {PACKAGE}.world import World
+from {PACKAGE}.maps.base import Map
+from {PACKAGE}.Player import HumanPlayer
+from {PACKAGE}.checkpoint import Checkpointer
+from {PACKAGE}.util import get_subclasses_from_file
+
+def build_world(**kwargs):
+    rooms = get_subclasses_from_file(os.path.abspath('project/rooms.py'), [Map], os.path.abspath('project'))[Map]
+    return World(rooms, **kwargs)
+
+def get_npc(room):
+    return next(obj for obj in room.get_map_objects() if isinstance(obj, NPC))
+"""
+
+def run_game_script(game_tree, script: str, check_output=lambda output: True):
+    """ Runs the script with the rooms above in a fresh interpreter, from the game tree, and returns the
+        JSON value it prints last. check_output is given what the script printed, and must accept it.
+    """
+    (game_tree / 'project' / 'rooms.py').write_text(ROOMS)
+    env = dict(os.environ, PYTHONPATH=str(game_tree), MEDIA_SOURCE_DIR=str(game_tree / 'media'), DATABASE='local')
+    result = subprocess.run([sys.executable, '-c', PRELUDE + textwrap.dedent(script)], cwd=game_tree, env=env, capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stderr
+    assert check_output(result.stdout), result.stdout
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def test_a_checkpoint_restores_the_rooms_after_a_restart(game_tree):
+    result = run_game_script(game_tree, """
+        checkpointer = Checkpointer('checkpoints')
+        world = build_world(checkpointer=checkpointer)
+        hall = world.get_room('Test Hall')
+        get_npc(hall).set_facing_direction('left')
+        player = HumanPlayer('ada', email='ada@mail.com')
+        player.change_room(hall)
+        player.move('down')
+
+        # a message that arrives while the states are captured is dispatched after the capture
+        dispatched, blocked = threading.Event(), []
+        def dispatch():
+            with world.dispatching():
+                dispatched.set()
+        get_runtime_state = hall.get_runtime_state
+        def get_runtime_state_while_dispatching():
+            threading.Thread(target=dispatch).start()
+            blocked.append(not dispatched.wait(0.5))
+            return get_runtime_state()
+        hall.get_runtime_state = get_runtime_state_while_dispatching
+        world.checkpoint()
+        checkpointer.flush()
+
+        world = build_world(checkpointer=Checkpointer('checkpoints')) # as after a restart
+        room, position = world.get_checkpointed_location('ada')
+        print(json.dumps([blocked, get_npc(world.get_room('Test Hall')).get_facing_direction(), room.get_name(), position.to_tuple()]))
+    """)
+    assert result == [[True], 'left', 'Test Hall', [3, 2]]
+
+def test_an_idle_room_hibernates_and_wakes_up_through_a_door(game_tree):
+    result = run_game_script(game_tree, """
+        world = build_world(idle_timeout=0)
+        player = HumanPlayer('ada', email='ada@mail.com')
+        player.change_room(world.get_room('Test Hall'))
+        get_npc(world.get_room('Test Garden')).set_facing_direction('up')
+        world.update()
+        hibernated = [world.is_hibernated('Test Hall'), world.is_hibernated('Test Garden')]
+
+        for _ in range(3): # onto the door
+            player.move('right')
+        print(json.dumps(hibernated + [
+            world.is_hibernated('Test Garden'),
+            player.get_current_room().get_name(),
+            player.get_current_position().to_tuple(),
+            get_npc(player.get_current_room()).get_facing_direction(),
+        ]))
+    """)
+    # the hall has a player, so only the garden hibernates; the door wakes it up with its NPC as it was
+    assert result == [False, True, False, 'Test Garden', [2, 0], 'up']
+
+def test_building_in_parallel_gives_the_same_world(game_tree):
+    result = run_game_script(game_tree, """
+        def describe(world):
+            rooms = {}
+            for room_name in sorted(world.get_room_names()):
+                room = world.get_room(room_name)
+                rooms[room_name] = {
+                    'objects': sorted(f'{type(obj).__name__}@{obj.get_position().to_tuple()}' for obj in room.get_map_objects()),
+                    'doors': sorted((exit.door.get_connected_room().get_name(), exit.door._Door__new_entry_point.to_tuple()) for exit in room.get_exits()),
+                }
+            return rooms
+        print(json.dumps([describe(build_world(build_workers=1)), describe(build_world(build_workers=2))]))
+    """, check_output=lambda output: 'building it here instead' not in output)
+    serial, parallel = result
+    assert parallel == serial
+    assert serial['Test Hall']['doors'] == [['Test Garden', [2, 0]]]
+    assert serial['Test Garden']['doors'] == [['Test Hall', [2, 5]]]
+
+def test_a_changed_room_file_is_reloaded_with_its_players(game_tree):
+    result = run_game_script(game_tree, """
+        world = build_world()
+        old_hall = world.get_room('Test Hall')
+        get_npc(old_hall).set_facing_direction('left')
+        player = HumanPlayer('ada', email='ada@mail.com')
+        player.change_room(old_hall)
+        player.move('down')
+
+        with open('project/rooms.py') as f:
+            source = f.read()
+        with open('project/rooms.py', 'w') as f:
+            f.write(source.replace("description='A hall.', size=(7, 7)", "description='A hall.', size=(8, 8)"))
+        messages = world.reload()
+
+        hall = player.get_current_room()
+        print(json.dumps([
+            hall is not old_hall, hall is world.get_room('Test Hall'), hall._map_rows,
+            [player.get_name() for player in hall.get_human_players()], player.get_current_position().to_tuple(),
+            get_npc(hall).get_facing_direction(), [json.loads(message.prepare()).get('text') for message in messages],
+        ]))
+    """)
+    assert result == [True, True, 8, ['ada'], [3, 2], 'left', ['Test Hall has been updated.', None]]
+
+def test_a_blocking_command_does_not_hold_up_the_other_messages(game_tree):
+    result = run_game_script(game_tree, """
+        import sys
+        from queue import Empty
+        from PACKAGE.server_local import ChatBackend
+
+        ChatBackend.STARTING_ROOM = 'Test Hall'
+        inbox, outbox = ChatBackend().start()
+        SlowCommand = sys.modules['project.rooms'].SlowCommand
+
+        def receive(text):
+            # returns the text of the next message sent that contains the given text (None if there is none)
+            try:
+                while True:
+                    message = json.loads(outbox.get(timeout=10))
+                    if text in message.get('text', ''):
+                        return message['text']
+            except Empty:
+                return None
+
+        inbox.put({'text': '/slow'})
+        acknowledgement = receive('/slow')
+        inbox.put({'text': 'hello'}) # dispatched while the command runs
+        chat = receive('hello')
+        SlowCommand.release.set()
+        print(json.dumps([acknowledgement, chat is not None, receive('Done on')]), flush=True)
+        os._exit(0) # without waiting for the threads of the backend
+    """.replace('PACKAGE', PACKAGE))
+    acknowledgement, chat_received, reply = result
+    assert acknowledgement == 'Running /slow. You will be notified when it completes.'
+    assert chat_received
+    assert reply is not None and reply.startswith('Done on command') # a thread of the command runner
@@ -1,15 +1,18 @@
 import os
+import struct
 import traceback
 from glob import glob
 from pathlib import Path
-from typing import Any, TYPE_CHECKING
-
-from PIL import Image
+from functools import lru_cache
+from typing import Any, Optional, TYPE_CHECKING
 
 from ..coord import Coord
+from ..util import lazy_import
 from ..resources import get_resource_path
 from ..message import Message, SenderInterface
 
+Image = lazy_import('PIL.Image')
+
 if TYPE_CHECKING:
     from Player import HumanPlayer
     from tiles.map_objects import Door
@@ -17,6 +20,24 @@ if TYPE_CHECKING:
 TILE_WIDTH = 16
 TILE_HEIGHT = 16
 
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+@lru_cache(maxsize=None)
+def get_image_size(path: str) -> Optional[tuple[int, int]]:
+    """ Returns the (width, height) of the image at the given path, or None if there is no such image.
+        PNG sizes are read from the file header, so Pillow is only loaded for other formats.
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as f:
+        header = f.read(24)
+    if header[:8] == PNG_SIGNATURE and header[12:16] == b'IHDR':
+        return struct.unpack('>II', header[16:24])
+
+    with Image.open(path) as image:
+        return image.size
+
 class GameEvent:
     """ An event that occurs in the game that objects may wish to be notified about. """
     def __init__(self, event_type, data=None) -> None:
@@ -61,6 +82,10 @@ class Exit:
         self.door_position: Coord = door_position
         self.linked_map: str = linked_map
 
+def get_class_key(cls: type) -> tuple[str, str]:
+    """ Returns what identifies a class across reloads of its module: its module and qualified name. """
+    return cls.__module__, cls.__qualname__
+
 class MapObject(SenderInterface):
     """ A class representing an object on the map. An object may consist of multiple tiles on the grid. """
 
@@ -136,15 +161,23 @@ class MapObject(SenderInterface):
         """ Called every second. """
         return []
 
+    def get_runtime_state(self) -> Optional[dict]:
+        """ Returns the state of the object that changes at runtime, as plain data (see Map.get_runtime_state),
+            or None if it has none. Objects with such a state should override this and set_runtime_state.
+        """
+        return None
+
+    def set_runtime_state(self, state: dict) -> None:
+        """ Restore the runtime state of a newly built object, as returned by get_runtime_state. """
+        pass
+
     def _get_image_size(self) -> tuple[int, int]:
         """ Returns the size of the image for the object. """
-        # load the image with PIL
-
-        if not os.path.exists(get_resource_path(f'image/{self._image_name}.png')):
+        image_size = get_image_size(get_resource_path(f'image/{self._image_name}.png'))
+        if image_size is None:
             return 1, 1
 
-        image = Image.open(get_resource_path(f'image/{self._image_name}.png'))
-        num_cols, num_rows = image.size[0] // TILE_WIDTH, image.size[1] // TILE_HEIGHT
+        num_cols, num_rows = image_size[0] // TILE_WIDTH, image_size[1] // TILE_HEIGHT
         return num_rows, num_cols
 
     def _get_tilemap(self) -> tuple[list[list[Any]], int, int]:
@@ -158,7 +191,22 @@ class MapObject(SenderInterface):
         tilemap: list[list[MapObject]] = [ [ self for _ in range(num_cols) ] for _ in range(num_rows) ]
         return tilemap, num_rows, num_cols
 
+    def get_shared_name(self) -> Optional[str]:
+        """ Returns the name under which the object is shared (see get_obj), or None if it is not shared. """
+        name = MapObject.OBJECT_NAMES.get(id(self))
+        if name is not None and MapObject.OBJECTS.get(name) is self:
+            return name
+        return None
+
+    def __reduce_ex__(self, protocol):
+        """ Objects shared through get_obj are pickled by name, so that they are still shared once unpickled. """
+        name = self.get_shared_name()
+        if name is not None:
+            return (MapObject.get_obj, (name,))
+        return super().__reduce_ex__(protocol)
+
     OBJECTS: dict[str, 'MapObject'] = {}
+    OBJECT_NAMES: dict[int, str] = {}
     @staticmethod
     def load_objects(map_object_classes=None) -> None:
         """ Load all map objects from the resources/image/tile directory. Should only be called once."""
@@ -191,9 +239,24 @@ class MapObject(SenderInterface):
             tile_cls = map_object_classes[tile_type]
             try:
                 MapObject.OBJECTS[image_name] = tile_cls(image_name)
+                MapObject.OBJECT_NAMES[id(MapObject.OBJECTS[image_name])] = image_name
             except:
                 raise ValueError(f"Could not instantiate {tile_cls} with {image_name}: {traceback.format_exc()}")
     
+    @staticmethod
+    def replace_classes(map_object_classes: list[type['MapObject']]) -> None:
+        """ Re-create the shared objects whose class has been reloaded, given the new classes. Classes are
+            matched by module and qualified name, since different modules may define classes of the same name.
+        """
+        new_classes = {get_class_key(cls): cls for cls in map_object_classes}
+        for image_name, obj in list(MapObject.OBJECTS.items()):
+            new_cls = new_classes.get(get_class_key(type(obj)))
+            if new_cls is None or new_cls is type(obj):
+                continue
+            del MapObject.OBJECT_NAMES[id(obj)]
+            MapObject.OBJECTS[image_name] = new_cls(image_name)
+            MapObject.OBJECT_NAMES[id(MapObject.OBJECTS[image_name])] = image_name
+
     @staticmethod
     def get_obj(image_name: str) -> 'MapObject':
         """ Get the map object with the given image name. """
@@ -1,4 +1,4 @@
-from typing import Any, TYPE_CHECKING
+from typing import Any, Callable, TYPE_CHECKING
 
 from ..message import *
 from ..coord import Coord
@@ -39,17 +39,24 @@ class Door(MapObject):
         self.__connected_room = None
         self.__linked_room = linked_room
 
-    def connect_to(self, connected_room: "Map", new_entry_point: Coord) -> None:
+    def connect_to(self, connected_room: "Map | Callable[[], Map]", new_entry_point: Coord) -> None:
+        """ Link the door to a room. The room may be given as a callable that returns it when the door is used. """
         self.__connected_room = connected_room
         self.__new_entry_point = new_entry_point
 
+    def get_connected_room(self) -> "Map | None":
+        """ Returns the room the door leads to, if any. """
+        if callable(self.__connected_room):
+            return self.__connected_room()
+        return self.__connected_room
+
     def player_entered(self, player) -> list[Message]:
         if self.__connected_room is None or self.__new_entry_point is None:
             print("Door has no link")
             return []
 
         # move player to the new map
-        return player.change_room(self.__connected_room, entry_point=self.__new_entry_point)
+        return player.change_room(self.get_connected_room(), entry_point=self.__new_entry_point)
 
     def get_exits(self) -> list[Exit]:
         return [Exit(self, self._position, self.__linked_room)]
@@ -0,0 +1,115 @@
+import threading
+from typing import TYPE_CHECKING, Optional
+
+from .database import db
+from .database_base import UserRecord
+
+if TYPE_CHECKING:
+    from Player import HumanPlayer
+
+class UserEntry(UserRecord):
+    """ A user of the directory, with their online status. It can be passed to db.get_state/update_state
+        like the UserRecord it extends.
+    """
+
+    def __init__(self, name: str, email: str = "") -> None:
+        super().__init__(name, email)
+        self.player: Optional["HumanPlayer"] = None # the player, while they are online
+        self.room_name: Optional[str] = None # the room of the player, while they are online
+
+    def is_online(self) -> bool:
+        return self.player is not None
+
+class UserDirectory:
+    """ Every user who has a state in the database, indexed by handle and by email. Handles can be looked up
+        ignoring case, unless several users have handles that only differ by case.
+        The users are read from the database when the directory is first used; after that, the backend
+        keeps the directory up to date as players connect, disconnect and change rooms.
+    """
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__by_handle: dict[str, UserEntry] = {}
+        self.__handles_by_lower: dict[str, set[str]] = {} # the handles that are the same ignoring case
+        self.__by_email: dict[str, UserEntry] = {}
+        self.__loaded: bool = False
+
+    def __ensure_loaded(self) -> None:
+        if self.__loaded:
+            return
+        users = db.get_all_users()
+        with self.__lock:
+            if self.__loaded:
+                return
+            for user in users:
+                self.__add(user.name, user.email)
+            self.__loaded = True
+
+    def __add(self, name: str, email: str) -> UserEntry:
+        # must be called with the lock held
+        entry = self.__by_handle.get(name)
+        if entry is None:
+            entry = UserEntry(name, email)
+            self.__by_handle[name] = entry
+            self.__handles_by_lower.setdefault(name.lower(), set()).add(name)
+        if len(email) > 0 and entry.email != email:
+            if self.__by_email.get(entry.email) is entry:
+                del self.__by_email[entry.email]
+            entry.email = email
+        if len(entry.email) > 0:
+            self.__by_email[entry.email] = entry
+        return entry
+
+    def get_user(self, handle: str) -> Optional[UserEntry]:
+        """ Returns the user with the given handle, or else the only user whose handle is the same ignoring
+            case. Returns None if there is no such user.
+        """
+        self.__ensure_loaded()
+        entry = self.__by_handle.get(handle)
+        if entry is None:
+            handles = self.__handles_by_lower.get(handle.lower(), set())
+            if len(handles) == 1:
+                entry = self.__by_handle.get(next(iter(handles)))
+        return entry
+
+    def get_user_by_email(self, email: str) -> Optional[UserEntry]:
+        """ Returns the user with the given email, or None if there is none. """
+        self.__ensure_loaded()
+        return self.__by_email.get(email)
+
+    def get_handles(self) -> list[str]:
+        """ Returns the handles of all users. """
+        self.__ensure_loaded()
+        return [entry.name for entry in list(self.__by_handle.values())]
+
+    def get_online_players(self) -> list["HumanPlayer"]:
+        """ Returns the players who are currently online. """
+        self.__ensure_loaded()
+        return [entry.player for entry in list(self.__by_handle.values()) if entry.player is not None]
+
+    def player_connected(self, player: "HumanPlayer") -> None:
+        """ Mark the player as online (adding them to the directory if they are new). """
+        self.__ensure_loaded()
+        with self.__lock:
+            entry = self.__add(player.get_name(), player.get_email())
+            entry.player = player
+            room = player.get_current_room()
+            entry.room_name = room.get_name() if room is not None else None
+        # the email is stored so that the directory can index offline users by email
+        if player.get_state('email', '') != player.get_email():
+            player.set_state('email', player.get_email())
+
+    def player_disconnected(self, player: "HumanPlayer") -> None:
+        """ Mark the player as offline. """
+        entry = self.get_user(player.get_name())
+        if entry is not None and entry.player is player:
+            entry.player = None
+            entry.room_name = None
+
+    def player_changed_room(self, player: "HumanPlayer", room_name: str) -> None:
+        """ Record the room that the (online) player is now in. """
+        entry = self.get_user(player.get_name())
+        if entry is not None and entry.player is player:
+            entry.room_name = room_name
+
+user_directory = UserDirectory()
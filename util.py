@@ -3,9 +3,34 @@ from glob import glob
 from collections import defaultdict
 import os, importlib, textwrap, sys, types
 
+from .profiler import profiler
+from .csv_tables import csv_tables
+
 root_folder: str = os.path.dirname(os.path.abspath(__file__))
 root_folder_name: str = os.path.basename(root_folder)
 
+class LazyModule(types.ModuleType):
+    """ A placeholder for a module that is only imported when one of its attributes is first used. """
+
+    def __init__(self, name: str) -> None:
+        super().__init__(name)
+        self.__module: types.ModuleType | None = None
+
+    def __getattr__(self, attr: str):
+        if self.__module is None:
+            with profiler.span(self.__name__, 'import'):
+                self.__module = importlib.import_module(self.__name__)
+        return getattr(self.__module, attr)
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    Returns the module with the given name, deferring the actual import until the module is used.
+    Use this for heavy dependencies that are only needed by some features, e.g. requests = lazy_import('requests').
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
 def get_ext_project_folder() -> str:
     """
     Returns the path to the external project folder.
@@ -26,6 +51,8 @@ def get_ext_project_folder() -> str:
 
     return folder
 
+DISCOVERED_MODULES: set[str] = set()
+
 def get_subclasses_from_file(filepath, base_classes, package_root):
     """
     Given the filepath to a Python source file, this function dynamically loads the module,
@@ -58,10 +85,17 @@ def get_subclasses_from_file(filepath, base_classes, package_root):
     module.__package__ = full_module_name.rpartition('.')[0]
 
     try:
-        spec.loader.exec_module(module)
+        with profiler.span(full_module_name, 'import', file=filepath):
+            spec.loader.exec_module(module)
     except:
         print("Error loading module", full_module_name, "from", filepath)
         return {}
+
+    # register the module so that its classes can be pickled by reference (e.g., to build maps in other processes).
+    # modules that were imported normally are left alone; modules loaded here are replaced when reloaded.
+    if full_module_name not in sys.modules or full_module_name in DISCOVERED_MODULES:
+        sys.modules[full_module_name] = module
+        DISCOVERED_MODULES.add(full_module_name)
     
     subclasses = defaultdict(dict)
     for name in dir(module):
@@ -78,7 +112,10 @@ def get_subclasses_from_file(filepath, base_classes, package_root):
                 subclasses[base_class][name] = obj
     return subclasses
 
-def get_subclasses_from_folders(base_classes, verbose=False) -> dict:
+def get_source_files() -> list[tuple[str, str]]:
+    """
+    Returns the Python files that may define maps and map objects, as (project root, file path) pairs.
+    """
     search_paths = [
         (root_folder_name, f'{root_folder_name}/maps/ext/'),
         (root_folder_name, f'{root_folder_name}/maps/'),
@@ -87,18 +124,23 @@ def get_subclasses_from_folders(base_classes, verbose=False) -> dict:
         ext_folder = get_ext_project_folder()
         search_paths.append((ext_folder, f'{ext_folder}/'))
 
-    classes = {}
+    source_files = []
     for project_root, filepath in search_paths:
-        files = list(glob(f"{filepath}/*.py"))
-        if verbose: print(project_root, filepath, files)
-        for file in files:
+        for file in glob(f"{filepath}/*.py"):
             if 'imports' in file: continue
-            found_classes = get_subclasses_from_file(file, base_classes, project_root)
-            for base_class, classes_ in found_classes.items():
-                if base_class not in classes:
-                    classes[base_class] = {}
-                classes[base_class].update(classes_)
-                if verbose: print("Found", len(classes_), "subclasses of", base_class, "in", file)
+            source_files.append((project_root, file))
+    return source_files
+
+def get_subclasses_from_folders(base_classes, verbose=False) -> dict:
+    classes = {}
+    for project_root, file in get_source_files():
+        if verbose: print(project_root, file)
+        found_classes = get_subclasses_from_file(file, base_classes, project_root)
+        for base_class, classes_ in found_classes.items():
+            if base_class not in classes:
+                classes[base_class] = {}
+            classes[base_class].update(classes_)
+            if verbose: print("Found", len(classes_), "subclasses of", base_class, "in", file)
     for base_class, classes_ in classes.items():
         if verbose: print("Found", len(classes_), "subclasses of", base_class)
         assert len(classes_) > 0
@@ -115,12 +157,10 @@ def shorten_lines(lines, max_length):
             short_lines.append(line)
     return short_lines
 
-def get_valid_emails():
-    if not os.path.exists('emails.csv'):
-        return []
+def get_valid_emails() -> frozenset[str]:
+    try:
+        emails = csv_tables.get_table('emails.csv', fieldnames=['Email'])
+    except FileNotFoundError:
+        return frozenset()
 
-    valid_emails = set()
-    with open('emails.csv') as f:
-        for line in f:
-            valid_emails.add(line.strip())
-    return valid_emails
\ No newline at end of file
+    return emails.get_value_set('Email') # computed once per load of the file
\ No newline at end of file
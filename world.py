@@ -0,0 +1,335 @@
+import os
+import re
+import sys
+import time
+import hashlib
+import threading
+import traceback
+from functools import partial
+from typing import Iterator, Optional
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+from .coord import Coord
+from .database import db
+from .maps.base import Map
+from .Player import HumanPlayer
+from .profiler import profiler
+from .checkpoint import Checkpointer
+from .tiles.base import MapObject, get_class_key
+from .database_entity import DatabaseEntity
+from .message import Message, GridMessage, ServerMessage
+from .util import get_source_files, get_subclasses_from_file, get_subclasses_from_folders
+
+def get_room_name(class_name: str) -> str:
+    """ Returns the name under which a room class is registered, e.g. TrottierTown -> Trottier Town. """
+    if '_' in class_name:
+        room_name = class_name.replace("_", " ")
+    else:
+        room_name = re.sub(r"(\w)([A-Z])", r"\1 \2", class_name)
+    words = room_name.split()
+    for i, word in enumerate(words):
+        if 1 < len(word) <= 3 and not word.isupper():
+            words[i] = words[i].lower()
+    room_name = ' '.join(words)
+    return room_name[0].upper() + room_name[1:]
+
+def _init_build_worker() -> None:
+    # worker processes that were not forked from the server must discover the classes themselves
+    if len(MapObject.OBJECTS) == 0:
+        MapObject.load_objects(get_subclasses_from_folders([MapObject])[MapObject])
+
+def _build_room(room_class: type[Map]) -> Map:
+    return room_class()
+
+def _get_file_stamp(filepath: str) -> tuple[int, int, str]:
+    stat = os.stat(filepath)
+    with open(filepath, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return stat.st_mtime_ns, stat.st_size, digest
+
+def _is_defined_in(cls: type, filepath: str) -> bool:
+    module = sys.modules.get(cls.__module__)
+    module_file = getattr(module, '__file__', None)
+    return module_file is not None and os.path.abspath(module_file) == os.path.abspath(filepath)
+
+class World:
+    """ Owns every room of the game. Rooms are built from their classes and linked through their doors.
+        A room that has had no human players for idle_timeout seconds is hibernated: its runtime state is
+        saved through the database and the room is dropped from memory. It is rebuilt transparently the
+        next time it is needed (e.g., when a player walks through a door leading to it).
+    """
+
+    def __init__(self, room_classes: dict[str, type[Map]], idle_timeout: Optional[float] = None, build_workers: Optional[int] = 1, checkpointer: Optional[Checkpointer] = None) -> None:
+        """ Build all rooms and connect their doors.
+
+        Arguments:
+            room_classes: the Map subclasses, by class name
+            idle_timeout: seconds without players before a room is hibernated (None to never hibernate)
+            build_workers: number of processes used to build the rooms (1 to build them in this process,
+                None for one process per core)
+            checkpointer: where to save checkpoints of the rooms (see checkpoint()); the rooms are restored
+                from the last checkpoint once they are built. None to disable checkpoints.
+        """
+        self.__idle_timeout: Optional[float] = idle_timeout
+        self.__checkpointer: Optional[Checkpointer] = checkpointer
+        self.__player_checkpoints: dict[str, dict] = {}
+        self.__lock = threading.RLock()
+        self.__room_classes: dict[str, type[Map]] = {get_room_name(name): cls for name, cls in room_classes.items()}
+        self.__rooms: dict[str, Map] = {}
+        self.__last_active: dict[str, float] = {}
+        self.__door_positions: dict[tuple[str, str], Coord] = {}
+        self.__file_stamps: dict[str, tuple[int, int, str]] = {}
+
+        with profiler.span('build rooms'):
+            if build_workers == 1:
+                for room_name, room_class in self.__room_classes.items():
+                    with profiler.span(room_name, 'room'):
+                        self.__rooms[room_name] = room_class()
+            else:
+                self.__build_rooms_in_parallel(build_workers)
+        for room_name, room in self.__rooms.items():
+            self.__last_active[room_name] = time.time()
+            self.__pin(room)
+        with profiler.span('pair doors'):
+            self.__pair_doors()
+        if checkpointer is not None:
+            with profiler.span('restore checkpoint'):
+                self.__restore_checkpoint()
+
+        for _, filepath in get_source_files():
+            self.__file_stamps[filepath] = _get_file_stamp(filepath)
+
+    def __build_rooms_in_parallel(self, build_workers: Optional[int]) -> None:
+        # rooms are independent until their doors are paired, so each one is built (and pickled back)
+        # by a worker process; a room that cannot be built or pickled there is built here instead.
+        with ProcessPoolExecutor(max_workers=build_workers, initializer=_init_build_worker) as executor:
+            futures = {room_name: executor.submit(_build_room, room_class) for room_name, room_class in self.__room_classes.items()}
+            for room_name, future in futures.items():
+                try:
+                    self.__rooms[room_name] = future.result()
+                except:
+                    print(f"Could not build {room_name} in a worker process, building it here instead:\n{traceback.format_exc()}")
+                    with profiler.span(room_name, 'room'):
+                        self.__rooms[room_name] = self.__room_classes[room_name]()
+
+    def __pair_doors(self) -> None:
+        # find the door position of each room towards each other room
+        doors: dict[tuple[str, str], list[tuple[str, Coord]]] = {}
+        for room_name, room in self.__rooms.items():
+            for exit in room.get_exits():
+                if len(exit.linked_map) == 0:
+                    continue
+                key = tuple(sorted([room_name, exit.linked_map]))
+                doors.setdefault(key, []).append((room_name, exit.door_position))
+
+        for (loc1_s, loc2_s), room_doors in doors.items():
+            if self.is_hibernated(loc1_s) or self.is_hibernated(loc2_s):
+                continue # already paired before the room was hibernated
+            if len(room_doors) != 2:
+                print(f"Expected 2 doors, got {len(room_doors)}, for {loc1_s} and {loc2_s}.")
+                continue
+            (room_from1, door1_pos), (room_from2, door2_pos) = room_doors
+            if {room_from1, room_from2} != {loc1_s, loc2_s}:
+                print(f"Expected one door in each room, for {loc1_s} and {loc2_s}.")
+                continue
+            self.__door_positions[(room_from1, room_from2)] = door1_pos
+            self.__door_positions[(room_from2, room_from1)] = door2_pos
+
+        for room_name, room in self.__rooms.items():
+            self.__connect_doors(room_name, room)
+
+    def __connect_doors(self, room_name: str, room: Map) -> None:
+        # doors resolve the linked room by name, so that they never hold on to a hibernated room
+        for exit in room.get_exits():
+            entry_point = self.__door_positions.get((exit.linked_map, room_name))
+            if entry_point is not None:
+                exit.door.connect_to(partial(self.get_room, exit.linked_map), entry_point)
+
+    @staticmethod
+    def __get_entities(room: Map) -> list[DatabaseEntity]:
+        # the room and its NPCs (players are pinned by the backend while they are online)
+        return [room] + [obj for obj in room.get_map_objects() if isinstance(obj, DatabaseEntity) and not isinstance(obj, HumanPlayer)]
+
+    def __pin(self, room: Map) -> None:
+        # keep the database state of a room in memory for as long as the room is
+        for entity in self.__get_entities(room):
+            db.pin(entity)
+
+    def __unpin(self, room: Map) -> None:
+        for entity in self.__get_entities(room):
+            db.unpin(entity)
+
+    def __restore_checkpoint(self) -> None:
+        room_states, self.__player_checkpoints = self.__checkpointer.load()
+        for room_name, state in room_states.items():
+            if room_name not in self.__rooms:
+                continue
+            try:
+                self.__rooms[room_name].set_runtime_state(state)
+            except:
+                print(f"Could not restore {room_name} from its checkpoint:\n{traceback.format_exc()}")
+
+    def checkpoint(self) -> None:
+        """ Capture the runtime state of the rooms in memory and the positions of their players, and queue
+            them to be written by the checkpointer. Rooms whose state did not change are not rewritten.
+        """
+        if self.__checkpointer is None:
+            return
+        room_states: dict[str, dict] = {}
+        with self.dispatching(): # no player acts and no room is rebuilt while the states are captured
+            for room_name, room in self.__rooms.items():
+                room_states[room_name] = room.get_runtime_state()
+                for player in room.get_human_players():
+                    self.__player_checkpoints[player.get_name()] = {
+                        'room': room_name,
+                        'position': player.get_current_position().to_tuple(),
+                    }
+            player_states = dict(self.__player_checkpoints)
+        self.__checkpointer.save(room_states, player_states) # written by the background thread of the checkpointer
+
+    def get_checkpointed_location(self, player_name: str) -> Optional[tuple[Map, Coord]]:
+        """ Returns the room and position of the player in the last checkpoint, if any (and still valid). """
+        checkpoint = self.__player_checkpoints.get(player_name)
+        if checkpoint is None or checkpoint['room'] not in self.__room_classes:
+            return None
+        room = self.get_room(checkpoint['room'])
+        position = Coord(*checkpoint['position'])
+        if not (0 <= position.y < room._map_rows and 0 <= position.x < room._map_cols):
+            return None
+        return room, position
+
+    def get_room_names(self) -> list[str]:
+        """ Returns the names of all rooms, including hibernated ones. """
+        return list(self.__room_classes)
+
+    def is_hibernated(self, room_name: str) -> bool:
+        """ Returns True if the room is currently not in memory. """
+        return room_name in self.__room_classes and room_name not in self.__rooms
+
+    def get_room(self, room_name: str) -> Map:
+        """ Returns the room with the given name, rebuilding it first if it was hibernated. """
+        with self.__lock:
+            self.__last_active[room_name] = time.time()
+            room = self.__rooms.get(room_name)
+            if room is None:
+                room = self.__wake(room_name)
+            return room
+
+    def __wake(self, room_name: str) -> Map:
+        room = self.__room_classes[room_name]()
+        runtime_state = room.get_state('runtime_state', None)
+        if runtime_state is not None:
+            room.set_runtime_state(runtime_state)
+        self.__connect_doors(room_name, room)
+        self.__rooms[room_name] = room
+        self.__pin(room)
+        return room
+
+    def hibernate(self, room_name: str) -> bool:
+        """ Save the runtime state of the room and drop it from memory. Returns False if the room
+            could not be hibernated because it has human players in it (or is already hibernated).
+        """
+        with self.__lock:
+            room = self.__rooms.get(room_name)
+            if room is None or len(room.get_human_players()) > 0:
+                return False
+            runtime_state = room.get_runtime_state()
+            room.set_state('runtime_state', runtime_state)
+            if self.__checkpointer is not None:
+                self.__checkpointer.save({room_name: runtime_state})
+            del self.__rooms[room_name]
+            self.__unpin(room)
+            return True
+
+    def update(self) -> list[Message]:
+        """ Update every room in memory, then hibernate the rooms that have been idle for too long. """
+        messages: list[Message] = []
+        now = time.time()
+        with self.__lock:
+            rooms = list(self.__rooms.items())
+        for room_name, room in rooms:
+            messages.extend(room.update())
+            if len(room.get_human_players()) > 0:
+                self.__last_active[room_name] = now
+
+        if self.__idle_timeout is not None:
+            with self.__lock:
+                for room_name in list(self.__rooms):
+                    if now - self.__last_active[room_name] >= self.__idle_timeout:
+                        self.hibernate(room_name)
+        return messages
+
+    @contextmanager
+    def dispatching(self) -> Iterator[None]:
+        """ Hold off reloads and hibernation while a message of a player is dispatched, so that the player
+            is not moved to a rebuilt room in the middle of their action (see ChatBackend.__parse_message).
+        """
+        with self.__lock:
+            yield
+
+    def reload(self) -> list[Message]:
+        """ Reload the source files that changed since they were last loaded, and rebuild the rooms that
+            they define (or that contain objects whose class they define). Players in a rebuilt room are
+            moved to the new room at their current position. Returns the messages for those players.
+        """
+        messages: list[Message] = []
+        for project_root, filepath in get_source_files():
+            stamp = self.__file_stamps.get(filepath)
+            stat = os.stat(filepath)
+            if stamp is not None and stamp[:2] == (stat.st_mtime_ns, stat.st_size):
+                continue
+            self.__file_stamps[filepath] = _get_file_stamp(filepath)
+            if stamp is not None and stamp[2] == self.__file_stamps[filepath][2]:
+                continue # touched, but not changed
+            messages.extend(self.__reload_file(project_root, filepath))
+        return messages
+
+    def __reload_file(self, project_root: str, filepath: str) -> list[Message]:
+        print("Reloading", filepath)
+        found_classes = get_subclasses_from_file(filepath, [Map, MapObject], project_root)
+        room_classes = {get_room_name(name): cls for name, cls in found_classes.get(Map, {}).items() if _is_defined_in(cls, filepath)}
+        object_classes = {get_class_key(cls): cls for cls in found_classes.get(MapObject, {}).values() if _is_defined_in(cls, filepath)}
+
+        messages: list[Message] = []
+        with self.__lock:
+            MapObject.replace_classes(list(object_classes.values()))
+            stale_rooms = set(room_classes)
+            for room_name, room in self.__rooms.items():
+                for obj in room.get_map_objects():
+                    if object_classes.get(get_class_key(type(obj)), type(obj)) is not type(obj):
+                        stale_rooms.add(room_name)
+                        break
+
+            self.__room_classes.update(room_classes)
+            for room_name in stale_rooms:
+                if room_name in self.__rooms or room_name not in self.__last_active: # hibernated rooms are rebuilt when woken up
+                    messages.extend(self.__rebuild(room_name))
+            self.__pair_doors()
+        return messages
+
+    def __rebuild(self, room_name: str) -> list[Message]:
+        new_room = self.__room_classes[room_name]()
+        self.__last_active[room_name] = time.time()
+        old_room = self.__rooms.get(room_name)
+        self.__rooms[room_name] = new_room
+        self.__pin(new_room)
+        if old_room is None:
+            return []
+        self.__unpin(old_room)
+
+        try:
+            new_room.set_runtime_state(old_room.get_runtime_state())
+        except:
+            print(f"Could not carry the runtime state of {room_name} over to the reloaded room:\n{traceback.format_exc()}")
+
+        messages: list[Message] = []
+        for player in old_room.get_human_players():
+            position = player.get_current_position()
+            old_room.remove_player(player)
+            if not (0 <= position.y < new_room._map_rows and 0 <= position.x < new_room._map_cols):
+                position = None
+            new_room.add_player(player, entry_point=position)
+            messages.append(ServerMessage(player, f"{room_name} has been updated."))
+            messages.append(GridMessage(player))
+        return messages